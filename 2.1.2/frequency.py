@@ -1,18 +1,225 @@
 #   a212_frequency.py
 #   Counts letters in a given string
+#   python frequency.py                        asks for a string like before
+#   python frequency.py corpus.txt -n 1 2 3    streams a file (or - for stdin) and
+#                                              prints the most common n-grams
+import argparse
+import mmap
+import sys
+
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    #numpy is optional, n-grams are counted with Counter without it
+    np = None
+
+#fold A-Z to a-z and drop everything else, for letters_only counting
+LETTERS = b"abcdefghijklmnopqrstuvwxyz"
+FOLD = bytes.maketrans(LETTERS.upper(), LETTERS)
+NOT_LETTERS = bytes(set(range(256)) - set(LETTERS) - set(LETTERS.upper()))
+
+#dense count arrays are used while alphabet**n is at most this many entries
+DENSE_LIMIT = 1 << 20
+#n-gram indexes have to fit in numpy's int64, longer n-grams are counted as bytes
+INDEX_LIMIT = 1 << 63
+
 
 def char_frequency(str1):
-    dict = {}
-    for n in str1:
-        keys = dict.keys()
-        if n in keys:
-            dict[n] += 1
+    #Counter does the counting in C, dict() keeps the first-seen order like before
+    return dict(Counter(str1))
+
+
+class FrequencyCounter:
+    """Counts n-grams of bytes (or just the letters a-z, case folded) over a
+    stream of chunks. The last few symbols of each chunk are carried over so
+    n-grams that cross a chunk boundary are still counted."""
+
+    def __init__(self, sizes=(1, 2, 3), letters_only=False):
+        self.sizes = sorted(set(sizes))
+        self.letters_only = letters_only
+        self.base = 26 if letters_only else 256
+        self.tail = b""
+        self.total = 0
+        self.dense = {}
+        self.sparse = {}
+        for n in self.sizes:
+            if np is not None and self.base ** n <= DENSE_LIMIT:
+                self.dense[n] = np.zeros(self.base ** n, dtype=np.int64)
+            else:
+                self.sparse[n] = Counter()
+
+    def _symbols(self, chunk):
+        if self.letters_only:
+            return bytes(chunk).translate(FOLD, NOT_LETTERS)
+        return bytes(chunk)
+
+    def update(self, chunk):
+        self._update_symbols(self._symbols(chunk))
+
+    def _update_symbols(self, data):
+        #data has already been through _symbols
+        if not data:
+            return
+        self.total += len(data)
+        joined = self.tail + data
+        for n in self.sizes:
+            #only n-grams that end inside the new data, the rest were counted last time
+            start = max(0, len(self.tail) - (n - 1))
+            self._count(n, joined[start:])
+        keep = self.sizes[-1] - 1
+        self.tail = joined[-keep:] if keep else b""
+
+    def _bytes_keys(self, n):
+        #without numpy, or when the index would overflow int64, counts are kept by n-gram bytes
+        return np is None or self.base ** n >= INDEX_LIMIT
+
+    def _count(self, n, data):
+        if len(data) < n:
+            return
+        if self._bytes_keys(n):
+            if n == 1:
+                #Counter of bytes gives ints, at most 256 of them to turn back into bytes
+                self.sparse[1].update({bytes((k,)): v for k, v in Counter(data).items()})
+            else:
+                self.sparse[n].update(data[i:i + n] for i in range(len(data) - n + 1))
+            return
+        #smallest integer type the n-gram index fits in, sorting/counting goes faster
+        dtype = np.uint32 if self.base ** n <= 1 << 32 else np.int64
+        codes = np.frombuffer(data, dtype=np.uint8).astype(dtype)
+        if self.letters_only:
+            codes -= ord("a")
+        #index of each n-gram = its symbols read as a base-`base` number
+        index = codes[:len(codes) - n + 1].copy()
+        for i in range(1, n):
+            index *= self.base
+            index += codes[i:len(codes) - n + 1 + i]
+        if n in self.dense:
+            self.dense[n] += np.bincount(index, minlength=self.base ** n)
         else:
-            dict[n] = 1
-    return dict
+            values, counts = np.unique(index, return_counts=True)
+            self.sparse[n].update(dict(zip(values.tolist(), counts.tolist())))
+
+    def _key(self, n, key):
+        #turns whatever the counts are stored under into the n-gram's bytes
+        if isinstance(key, bytes):
+            return key
+        symbols = []
+        for i in range(n):
+            key, symbol = divmod(key, self.base)
+            symbols.append(symbol + ord("a") if self.letters_only else symbol)
+        return bytes(reversed(symbols))
+
+    def counter(self, n):
+        """Counter of n-gram bytes -> count"""
+        if n in self.dense:
+            counts = self.dense[n]
+            found = np.nonzero(counts)[0]
+            return Counter({self._key(n, int(i)): int(counts[i]) for i in found})
+        return Counter({self._key(n, key): count for key, count in self.sparse[n].items()})
+
+    def array(self, n):
+        """Dense numpy array of counts indexed by the n-gram read as a base-26 or
+        base-256 number, only for sizes small enough to be kept dense"""
+        if n not in self.dense:
+            raise ValueError("%d-grams are not kept as a dense array here" % n)
+        return self.dense[n]
+
+    def most_common(self, n, top=None):
+        return self.counter(n).most_common(top)
+
+    def gram_index(self, gram):
+        #the number an n-gram is stored under (see _count)
+        index = 0
+        for symbol in gram:
+            index = index * self.base + (symbol - ord("a") if self.letters_only else symbol)
+        return index
+
+    def add_gram(self, gram, count=1):
+        """Adds one n-gram (as symbol bytes) directly, used to stitch shard boundaries"""
+        n = len(gram)
+        if n in self.dense:
+            self.dense[n][self.gram_index(gram)] += count
+        elif n in self.sparse:
+            key = gram if self._bytes_keys(n) else self.gram_index(gram)
+            self.sparse[n][key] += count
+
+    def merge(self, other):
+        """Adds another counter's counts into this one (same sizes and letters_only)"""
+        if other.sizes != self.sizes or other.letters_only != self.letters_only:
+            raise ValueError("can only merge counters with the same sizes and alphabet")
+        self.total += other.total
+        for n in self.sizes:
+            if n in self.dense:
+                self.dense[n] += other.dense[n]
+            else:
+                self.sparse[n].update(other.sparse[n])
+        return self
+
+
+def iter_chunks(source, chunk_size=1 << 20):
+    """Yields chunks of a path or a binary file. Regular files are memory-mapped
+    and handed out as memoryview slices, nothing is copied until counting"""
+    if isinstance(source, str):
+        if source == "-":
+            yield from iter_chunks(sys.stdin.buffer, chunk_size)
+            return
+        with open(source, "rb") as f:
+            try:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                #empty files and pipes can't be mapped
+                yield from iter_chunks(f, chunk_size)
+                return
+            with mapped:
+                view = memoryview(mapped)
+                try:
+                    for start in range(0, len(view), chunk_size):
+                        piece = view[start:start + chunk_size]
+                        yield piece
+                        piece.release()
+                finally:
+                    view.release()
+        return
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def count_ngrams(source, sizes=(1, 2, 3), letters_only=False, chunk_size=1 << 20):
+    """Streams a path or binary file through a FrequencyCounter and returns it"""
+    counter = FrequencyCounter(sizes, letters_only)
+    for chunk in iter_chunks(source, chunk_size):
+        counter.update(chunk)
+    return counter
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Letter and n-gram frequencies")
+    parser.add_argument("input", nargs="?", help="file to analyze, - for stdin, asks for a string if left out")
+    parser.add_argument("-n", "--ngrams", type=int, nargs="+", default=[1])
+    parser.add_argument("--letters", action="store_true", help="only count a-z, case folded")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args(argv)
+
+    if args.input is None:
+        phrase = input("Enter the string to analyze: ")
+        count_letters = char_frequency(phrase)
+
+        for keys, values in count_letters.items():
+          print(keys, ":", values)
+        return 0
+
+    counter = count_ngrams(args.input, args.ngrams, args.letters)
+    for n in counter.sizes:
+        print("%d-grams:" % n)
+        for gram, count in counter.most_common(n, args.top):
+            print(" ", gram.decode("latin-1"), ":", count)
+    return 0
 
-phrase = input("Enter the string to analyze: ")
-count_letters = char_frequency(phrase)
 
-for keys, values in count_letters.items():
-  print(keys, ":", values)
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,361 @@
+#   a212_frequency_sketch.py
+#   Frequency counts that can be split across processes and added back together
+#   exact counts for characters (frequency.FrequencyCounter), Count-Min sketches
+#   with a fixed size for longer n-grams and whole words
+#
+#   python frequency_sketch.py big1.txt big2.txt --workers 8 --query the and tion
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import pickle
+import random
+import sys
+
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import frequency as frequency
+
+np = frequency.np
+
+MASK64 = (1 << 64) - 1
+#case folds letters and turns everything else into a space, so bytes.split() finds the words
+WORD_TABLE = bytes(c if c in frequency.LETTERS else ord(" ") for c in frequency.FOLD)
+IS_LETTER = frozenset(frequency.LETTERS)
+
+
+def word_key(word):
+    #64 bit number for a word so it can go through the same hashes as n-grams
+    return int.from_bytes(hashlib.blake2b(word, digest_size=8).digest(), "big")
+
+
+class CountMinSketch:
+    """depth rows of width counters. Each key adds to one counter per row
+    (multiply-shift hashing) and a query returns the smallest of them, so it
+    never undercounts. Memory is width * depth * 8 bytes whatever the vocabulary.
+    Sketches with the same width, depth and seed can be merged by adding tables"""
+
+    def __init__(self, width=1 << 16, depth=4, seed=212):
+        if width & (width - 1):
+            raise ValueError("width has to be a power of two")
+        self.width = width
+        self.depth = depth
+        self.seed = seed
+        self.shift = 64 - (width.bit_length() - 1)
+        rng = random.Random(seed)
+        #odd multipliers for multiply-shift, one (a, b) pair per row
+        self.a = [rng.getrandbits(64) | 1 for i in range(depth)]
+        self.b = [rng.getrandbits(64) for i in range(depth)]
+        self.total = 0
+        if np is not None:
+            self.table = np.zeros((depth, width), dtype=np.uint64)
+        else:
+            self.table = [[0] * width for i in range(depth)]
+
+    def _rows(self, key):
+        return [((a * key + b) & MASK64) >> self.shift for a, b in zip(self.a, self.b)]
+
+    def add(self, key, count=1):
+        for row, column in enumerate(self._rows(key)):
+            self.table[row][column] += count
+        self.total += count
+
+    def add_many(self, keys, counts=None):
+        """Adds counts[i] (1 if counts is left out) for every key in a numpy array
+        of non-negative ints (or any iterable)"""
+        if np is None or not isinstance(keys, np.ndarray):
+            if counts is None:
+                for key in keys:
+                    self.add(int(key))
+            else:
+                for key, count in zip(keys, counts):
+                    self.add(int(key), int(count))
+            return
+        keys = keys.astype(np.uint64)
+        if counts is not None:
+            counts = np.asarray(counts, dtype=np.float64)
+        for row in range(self.depth):
+            #uint64 arithmetic wraps mod 2^64, which is what multiply-shift wants
+            columns = (keys * np.uint64(self.a[row]) + np.uint64(self.b[row])) >> np.uint64(self.shift)
+            added = np.bincount(columns.astype(np.int64), weights=counts, minlength=self.width)
+            self.table[row] += added.astype(np.uint64)
+        self.total += len(keys) if counts is None else int(counts.sum())
+
+    def query(self, key):
+        return int(min(self.table[row][column] for row, column in enumerate(self._rows(key))))
+
+    def merge(self, other):
+        if (other.width, other.depth, other.seed) != (self.width, self.depth, self.seed):
+            raise ValueError("can only merge sketches with the same width, depth and seed")
+        if np is not None:
+            self.table += other.table
+        else:
+            for row in range(self.depth):
+                self.table[row] = [x + y for x, y in zip(self.table[row], other.table[row])]
+        self.total += other.total
+        return self
+
+    def to_bytes(self):
+        #one JSON header line, then the table as little-endian uint64s
+        header = json.dumps({"width": self.width, "depth": self.depth, "seed": self.seed,
+                             "total": self.total}).encode() + b"\n"
+        if np is not None:
+            body = self.table.astype("<u8").tobytes()
+        else:
+            body = b"".join(value.to_bytes(8, "little") for row in self.table for value in row)
+        return header + body
+
+    @classmethod
+    def from_bytes(cls, data):
+        line, body = bytes(data).split(b"\n", 1)
+        header = json.loads(line)
+        sketch = cls(header["width"], header["depth"], header["seed"])
+        sketch.total = header["total"]
+        if len(body) != sketch.width * sketch.depth * 8:
+            raise ValueError("sketch table has the wrong size")
+        if np is not None:
+            sketch.table = np.frombuffer(body, dtype="<u8").reshape(sketch.depth, sketch.width).astype(np.uint64)
+        else:
+            values = [int.from_bytes(body[i:i + 8], "little") for i in range(0, len(body), 8)]
+            sketch.table = [values[row * sketch.width:(row + 1) * sketch.width] for row in range(sketch.depth)]
+        return sketch
+
+
+class CorpusCounts:
+    """Exact counts for the n-gram sizes in exact_sizes, Count-Min sketches for
+    sketch_sizes and for words. Feed it chunks with update() and call finish()
+    at the end of the stream. A shard (a byte range out of a bigger file) keeps
+    its first/last few symbols and its partial first/last word instead, and
+    merge_shards() stitches those back together in order"""
+
+    def __init__(self, exact_sizes=(1, 2), sketch_sizes=(3, 4), words=True, letters_only=True,
+                 width=1 << 16, depth=4, shard=False):
+        self.exact = frequency.FrequencyCounter(exact_sizes, letters_only)
+        self.letters_only = letters_only
+        self.sketch_sizes = sorted(set(sketch_sizes))
+        #one helper counter is only used for its index arithmetic
+        self._index = frequency.FrequencyCounter((1,), letters_only)
+        self.sketches = {n: CountMinSketch(width, depth) for n in self.sketch_sizes}
+        self.words = CountMinSketch(width, depth) if words else None
+        self.keep = max(list(exact_sizes) + self.sketch_sizes) - 1
+        self.shard = shard
+        self.head = b""
+        self.tail = b""
+        #word state: partial is the unfinished word at the end so far,
+        #leading is a shard's first word (None until a delimiter shows up)
+        self.partial = b""
+        self.started = False
+        self.began_with_letter = False
+        self.leading = None
+
+    def _sketch_grams(self, n, data):
+        if len(data) < n:
+            return
+        if np is not None:
+            codes = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+            if self.letters_only:
+                codes -= np.uint64(ord("a"))
+            index = codes[:len(codes) - n + 1].copy()
+            for i in range(1, n):
+                index *= np.uint64(self._index.base)
+                index += codes[i:len(codes) - n + 1 + i]
+            self.sketches[n].add_many(index)
+        else:
+            self.sketches[n].add_many(self._index.gram_index(data[i:i + n]) for i in range(len(data) - n + 1))
+
+    def _count_words(self, words):
+        #each distinct word is hashed once and the whole chunk goes to the sketch in one call
+        counts = Counter(words)
+        counts.pop(b"", None)
+        if not counts:
+            return
+        keys = [word_key(word) for word in counts]
+        if np is not None:
+            self.words.add_many(np.array(keys, dtype=np.uint64), list(counts.values()))
+        else:
+            self.words.add_many(keys, counts.values())
+
+    def _words(self, data):
+        #data went through WORD_TABLE, words are the runs of a-z between spaces
+        if not data:
+            return
+        if not self.started:
+            self.started = True
+            self.began_with_letter = data[0] in IS_LETTER
+        words = data.split()
+        completed = []
+        if data[0] in IS_LETTER:
+            words[0] = self.partial + words[0]
+        else:
+            completed.append(self.partial)
+        self.partial = words.pop() if data[-1] in IS_LETTER else b""
+        completed.extend(words)
+        if self.shard and self.leading is None and b" " in data:
+            #first delimiter of the shard: the run before it might have started
+            #in the previous shard, so merge_shards counts it instead
+            self.leading = completed.pop(0) if self.began_with_letter else b""
+        self._count_words(completed)
+
+    def update(self, chunk):
+        data = self.exact._symbols(chunk)
+        if self.words is not None:
+            #words need the delimiters, so they get their own pass over the raw chunk
+            self._words(bytes(chunk).translate(WORD_TABLE))
+        if not data:
+            return
+        self.exact._update_symbols(data)
+        if len(self.head) < self.keep:
+            self.head += data[:self.keep - len(self.head)]
+        joined = self.tail + data
+        for n in self.sketch_sizes:
+            start = max(0, len(self.tail) - (n - 1))
+            self._sketch_grams(n, joined[start:])
+        self.tail = joined[-self.keep:] if self.keep else b""
+
+    def finish(self):
+        #end of a whole stream: the last word is complete
+        if self.words is not None and not self.shard:
+            self._count_words([self.partial])
+            self.partial = b""
+
+    def add_gram(self, gram):
+        n = len(gram)
+        if n in self.exact.sizes:
+            self.exact.add_gram(gram)
+        if n in self.sketches:
+            self.sketches[n].add(self._index.gram_index(gram))
+
+    def merge(self, other):
+        """Adds counts only, boundaries between shards are left to merge_shards"""
+        self.exact.merge(other.exact)
+        for n in self.sketch_sizes:
+            self.sketches[n].merge(other.sketches[n])
+        if self.words is not None:
+            self.words.merge(other.words)
+        return self
+
+    def ngram(self, gram):
+        """Count of an n-gram: exact if its size is kept exactly, else the sketch estimate"""
+        if isinstance(gram, str):
+            gram = gram.encode()
+        if self.letters_only:
+            gram = gram.lower()
+        n = len(gram)
+        if n in self.exact.sizes:
+            return self.exact.counter(n).get(gram, 0)
+        return self.sketches[n].query(self._index.gram_index(gram))
+
+    def word(self, word):
+        #words are always counted case folded
+        if isinstance(word, str):
+            word = word.encode()
+        return self.words.query(word_key(word.lower()))
+
+    def to_bytes(self):
+        return pickle.dumps(self)
+
+    @staticmethod
+    def from_bytes(data):
+        return pickle.loads(data)
+
+
+def merge_shards(shards):
+    """Merges CorpusCounts for consecutive shards of one stream (in order) and
+    counts the n-grams and the word that straddle each boundary"""
+    total = None
+    tail = b""
+    word = b""
+    for shard in shards:
+        if total is None:
+            total = shard
+            total.shard = False
+        else:
+            total.merge(shard)
+        #n-grams that start in what came before and end inside this shard's head
+        joined = tail + shard.head
+        sizes = sorted(set(total.exact.sizes) | set(total.sketch_sizes))
+        for n in sizes:
+            for i in range(max(0, len(tail) - n + 1), len(tail)):
+                if i + n <= len(joined):
+                    total.add_gram(joined[i:i + n])
+        tail = (tail + shard.tail)[-total.keep:] if total.keep else b""
+        if total.words is not None:
+            if shard.leading is None:
+                #no delimiter anywhere in this shard, it all belongs to one word
+                word += shard.partial
+            else:
+                total._count_words([word + shard.leading if shard.began_with_letter else word])
+                word = shard.partial
+    if total is None:
+        return None
+    total.head = b""
+    total.tail = tail
+    total.partial = word
+    total.finish()
+    return total
+
+
+def _count_shard(path, start, end, options, chunk_size=1 << 20):
+    counts = CorpusCounts(shard=True, **options)
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for offset in range(start, end, chunk_size):
+                counts.update(mapped[offset:min(offset + chunk_size, end)])
+    return counts
+
+
+def _in_order(executor, shards, options, window):
+    #runs shards on the pool but only keeps `window` of them in flight, results
+    #come back in order and each one is dropped once it has been merged
+    pending = deque()
+    for path, start, end in shards:
+        pending.append(executor.submit(_count_shard, path, start, end, options))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def count_corpus(paths, workers=None, shard_size=64 << 20, **options):
+    """Splits every file into shard_size byte ranges, counts them on a process
+    pool and merges the results. Returns one CorpusCounts for all files.
+    Memory stays at a few sketches per worker however many shards there are"""
+    workers = workers or os.cpu_count() or 1
+    total = None
+    with ProcessPoolExecutor(workers) as executor:
+        for path in paths:
+            size = os.path.getsize(path)
+            shards = [(path, start, min(start + shard_size, size)) for start in range(0, size, shard_size)]
+            merged = merge_shards(_in_order(executor, shards, options, 2 * workers))
+            if merged is None:
+                continue
+            #separate files don't run into each other, so only counts are added
+            total = merged if total is None else total.merge(merged)
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Count characters, n-grams and words over big files in parallel")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-size", type=int, default=64 << 20)
+    parser.add_argument("--query", nargs="*", default=[], help="n-grams (or words with --words) to look up")
+    parser.add_argument("--words", action="store_true", help="look the --query strings up as words")
+    parser.add_argument("--top", type=int, default=10, help="most common characters to show")
+    args = parser.parse_args(argv)
+
+    counts = count_corpus(args.paths, args.workers, args.shard_size)
+    if counts is None:
+        print("nothing to count")
+        return 0
+    for gram, count in counts.exact.most_common(1, args.top):
+        print(gram.decode("latin-1"), ":", count)
+    for text in args.query:
+        print(text, ":", counts.word(text) if args.words else counts.ngram(text))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,13 @@
 #   a212_generate_keys.py
 import rsa as rsa
+import rsa_keystore as rsa_keystore
 
 print("Generating your public/private keypairs now . . .")
 keys = rsa.generate_keypair()
 print("Public key: ", keys[0])
 print("Private key: ", keys[1])
 print("Modulus: ",keys[2])
+
+#saved with its CRT values, load it again with rsa_keystore.default_keystore().load(key id)
+store = rsa_keystore.default_keystore()
+print("Key id: ", store.save(keys))
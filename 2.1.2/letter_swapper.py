@@ -1,25 +1,112 @@
 #   a212_letter_swapper.py
-#   Implementation of RSA cryptography 
-#   using samples of large numbers
-
-input_string = input("Enter the string to analyze: ")
-new_string = input_string
-temp_string = input_string
-replace_letter = input("What letter in the orignal would you like to replace (qq to quit): ")
-
-
-while (replace_letter != "qq"):
-  replace_with = input("What letter would you like to replace it with (qq to quit): ")
-  temp_string = input_string
-  for i in range(0,len(temp_string)):
-    if (replace_letter == input_string[i]):
-      temp_string = temp_string[:i] + replace_with  +temp_string[i+1:]
-      new_string = new_string[:i] + replace_with  +new_string[i+1:]
-       
-  print("")
-  print ("Orginal String:" + input_string)
-  print("")
-  print ("New String:" + new_string)
-  print("")
+#   Swaps letters in a string to help break substitution ciphers by hand
+#   Swaps are always applied to the original string, so the current state is
+#   just a table of what each character maps to. Undo and redo swap tables
+#   instead of redoing string edits.
+#
+#   At the prompts:
+#     a then x        replace every a in the original with x
+#     abc then xyz    several swaps at once (a->x, b->y, c->z)
+#     uu / rr         undo / redo
+#     qq              quit
 
+#every character below 256 maps to itself until it is swapped
+IDENTITY = tuple(chr(i) for i in range(256))
+
+
+class SubstitutionEngine:
+  """Keeps the original text and a 256-entry table of what each character is
+  replaced with. The new text is one str.translate of the original, made again
+  only after the table changes. Characters past 255 are left alone"""
+
+  def __init__(self, text):
+    self.original = text
+    self.table = IDENTITY
+    self.undo_stack = []
+    self.redo_stack = []
+    self._text = text
+
+  def apply(self, swaps):
+    """Applies many swaps as one step (one undo). swaps is a dict or pairs of
+    (letter in the original, replacement)"""
+    if isinstance(swaps, dict):
+      swaps = swaps.items()
+    table = list(self.table)
+    for letter, replacement in swaps:
+      if len(letter) != 1 or ord(letter) > 255:
+        raise ValueError("can only replace single characters below 256, not %r" % letter)
+      table[ord(letter)] = replacement
+    self.undo_stack.append(self.table)
+    self.redo_stack.clear()
+    self._set(tuple(table))
+
+  def swap(self, letter, replacement):
+    self.apply([(letter, replacement)])
+
+  def undo(self):
+    """Goes back one step, False if there is nothing to undo"""
+    if not self.undo_stack:
+      return False
+    self.redo_stack.append(self.table)
+    self._set(self.undo_stack.pop())
+    return True
+
+  def redo(self):
+    if not self.redo_stack:
+      return False
+    self.undo_stack.append(self.table)
+    self._set(self.redo_stack.pop())
+    return True
+
+  def _set(self, table):
+    self.table = table
+    self._text = None
+
+  @property
+  def text(self):
+    #the translate only runs once per change, not once per look
+    if self._text is None:
+      self._text = self.original.translate(self.table)
+    return self._text
+
+  def mapping(self):
+    """dict of the characters that are currently swapped"""
+    return {chr(i): out for i, out in enumerate(self.table) if out != IDENTITY[i]}
+
+
+def main():
+  input_string = input("Enter the string to analyze: ")
+  engine = SubstitutionEngine(input_string)
   replace_letter = input("What letter in the orignal would you like to replace (qq to quit): ")
+
+  while (replace_letter != "qq"):
+    if replace_letter == "uu":
+      if not engine.undo():
+        print("Nothing to undo")
+    elif replace_letter == "rr":
+      if not engine.redo():
+        print("Nothing to redo")
+    else:
+      replace_with = input("What letter would you like to replace it with (qq to quit): ")
+      if replace_with == "qq":
+        break
+      try:
+        if len(replace_letter) > 1 and len(replace_with) == len(replace_letter):
+          #several letters at once, paired up by position
+          engine.apply(zip(replace_letter, replace_with))
+        else:
+          engine.swap(replace_letter, replace_with)
+      except ValueError as error:
+        print("Error:", error)
+
+    print("")
+    print ("Orginal String:" + engine.original)
+    print("")
+    print ("New String:" + engine.text)
+    print("")
+
+    replace_letter = input("What letter in the orignal would you like to replace (qq to quit): ")
+
+
+if __name__ == "__main__":
+  main()
@@ -1,8 +1,23 @@
 #   a212_cipher.py
 #   Rotation Cipher
+#   python main.py                       asks for mode, message and key
+#   python main.py -m e -k 3 file.txt    streams a file (or stdin) to stdout
+import argparse
+import sys
+
+try:
+  import numpy as np
+except ImportError:
+  #numpy is optional, bruteForce counts letters with bytes.count without it
+  np = None
 
 MAX_KEY_SIZE = 26 
 
+#how often each letter a-z shows up in English text, in percent
+ENGLISH_FREQ = [8.167, 1.492, 2.782, 4.253, 12.702, 2.228, 2.015, 6.094, 6.966, 0.153,
+                0.772, 4.025, 2.406, 6.749, 7.507, 1.929, 0.095, 5.987, 6.327, 9.056,
+                2.758, 0.978, 2.360, 0.150, 1.974, 0.074]
+
 def getMode():
   while True:
     print('Do you wish to encrypt or decrypt a message?')
@@ -25,44 +40,128 @@ def getKey():
     if (key >= 1 and key <= MAX_KEY_SIZE):
       return key
 
-def getTranslatedMessage(mode, message, key):
+#translation tables already built, keyed by ('e' or 'd', key)
+_tables = {}
+
+def getTranslationTables(mode, key):
+  #returns (str table, bytes table) for this mode and key, built once and reused
   if mode[0] == 'd':
     key = -key
-  translated = ''
-
-  for symbol in message:
-    if symbol.isalpha():
-      num = ord(symbol)
-      num += key
-
-      if symbol.isupper():
-        if num > ord('Z'):
-          num -= 26
-        elif num < ord('A'):
-          num += 26
-      elif symbol.islower():
-        if num > ord('z'):
-          num -= 26
-        elif num < ord('a'):
-          num += 26
-    
-      translated += chr(num)
-    
-    else:
-      translated += symbol
+  if (mode[0], key) not in _tables:
+    upper = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    lower = upper.lower()
+    shift = key % 26
+    source = upper + lower
+    target = upper[shift:] + upper[:shift] + lower[shift:] + lower[:shift]
+    _tables[(mode[0], key)] = (str.maketrans(source, target),
+                               bytes.maketrans(source.encode(), target.encode()))
+  return _tables[(mode[0], key)]
+
+def getTranslatedMessage(mode, message, key):
+  #str.translate does the whole message in C instead of one += per character
+  return message.translate(getTranslationTables(mode, key)[0])
+
+def getTranslatedBytes(mode, data, key):
+  #same rotation for binary input, only the ASCII letters change
+  return bytes(data).translate(getTranslationTables(mode, key)[1])
+
+def sampleText(data, sample):
+  #big inputs are scored on evenly spaced slices so the cost stays about the same
+  if len(data) <= sample:
+    return data
+  pieces = 16
+  step = len(data) // pieces
+  size = sample // pieces
+  return b''.join(data[i * step:i * step + size] for i in range(pieces))
+
+def letterCounts(data):
+  #counts of a-z in ASCII bytes, upper and lower case together
+  if np is not None:
+    codes = np.frombuffer(data, dtype=np.uint8) | 0x20
+    counts = np.bincount(codes, minlength=256)[ord('a'):ord('z') + 1]
+    return counts.astype(float)
+  data = data.lower()
+  return [data.count(letter) for letter in b'abcdefghijklmnopqrstuvwxyz']
+
+def bruteForce(message, sample=1 << 16):
+  """Scores every key with a chi-squared test against English letter
+  frequencies and returns [(key, score), ...] best (lowest) first.
+  The letters are counted once, decrypting with key k just moves count
+  (i + k) to letter i, so all 26 keys are scored from the same counts"""
+  if isinstance(message, str):
+    message = message.encode('ascii', 'ignore')
+  counts = letterCounts(sampleText(bytes(message), sample))
+  total = sum(counts)
+  if total == 0:
+    return [(key, 0.0) for key in range(1, MAX_KEY_SIZE + 1)]
+  if np is not None:
+    expected = np.array(ENGLISH_FREQ) * total / 100
+    #row k-1 holds the counts seen after decrypting with key k
+    index = (np.arange(26)[None, :] + np.arange(1, MAX_KEY_SIZE + 1)[:, None]) % 26
+    observed = counts[index]
+    scores = (((observed - expected) ** 2) / expected).sum(axis=1).tolist()
+  else:
+    expected = [f * total / 100 for f in ENGLISH_FREQ]
+    scores = []
+    for key in range(1, MAX_KEY_SIZE + 1):
+      scores.append(sum((counts[(i + key) % 26] - expected[i]) ** 2 / expected[i] for i in range(26)))
+  ranked = [(key, scores[key - 1]) for key in range(1, MAX_KEY_SIZE + 1)]
+  ranked.sort(key=lambda pair: pair[1])
+  return ranked
+
+def translateStream(mode, key, source, target, chunk_size=1 << 16):
+  #source and target are binary files, memory use is one chunk whatever the input size
+  #mode 'brute' scores the first chunk_size bytes and decrypts everything with the best key
+  first = source.read(chunk_size)
+  if mode[0] == 'b':
+    key = bruteForce(first)[0][0]
+    mode = 'decrypt'
+  table = getTranslationTables(mode, key)[1]
+  chunk = first
+  while chunk:
+    target.write(chunk.translate(table))
+    chunk = source.read(chunk_size)
+  target.flush()
+  return key
+
+def interactive():
+  mode = getMode()
+  message = getMessage()
+
+  if mode[0] != 'b':
+    key = getKey()
+
 
-  return translated
+  print('Your translated text is:')
+  if mode[0] != 'b':
+    print(getTranslatedMessage(mode, message, key))
+  else:
+    #most English looking keys first
+    for key, score in bruteForce(message):
+      print(key, getTranslatedMessage('decrypt', message, key))
 
-mode = getMode()
-message = getMessage()
+def main(argv=None):
+  parser = argparse.ArgumentParser(description='Rotation cipher. With no options it asks questions like before.')
+  parser.add_argument('-m', '--mode', choices=['encrypt', 'e', 'decrypt', 'd', 'brute', 'b'])
+  parser.add_argument('-k', '--key', type=int, help='1-%s, not needed for brute' % MAX_KEY_SIZE)
+  parser.add_argument('input', nargs='?', help='file to read, stdin if left out')
+  parser.add_argument('--chunk-size', type=int, default=1 << 16)
+  args = parser.parse_args(argv)
 
-if mode[0] != 'b':
-  key = getKey()
+  if args.mode is None:
+    interactive()
+    return 0
+  if args.mode[0] != 'b' and (args.key is None or not 1 <= args.key <= MAX_KEY_SIZE):
+    parser.error('--key between 1 and %s is needed to encrypt or decrypt' % MAX_KEY_SIZE)
 
+  if args.input is None or args.input == '-':
+    key = translateStream(args.mode, args.key, sys.stdin.buffer, sys.stdout.buffer, args.chunk_size)
+  else:
+    with open(args.input, 'rb') as source:
+      key = translateStream(args.mode, args.key, source, sys.stdout.buffer, args.chunk_size)
+  if args.mode[0] == 'b':
+    print('key:', key, file=sys.stderr)
+  return 0
 
-print('Your translated text is:')
-if mode[0] != 'b':
-  print(getTranslatedMessage(mode, message, key))
-else:
-  for key in range(1, MAX_KEY_SIZE + 1):
-    print(key, getTranslatedMessage('decrypt', message, key))
+if __name__ == '__main__':
+  sys.exit(main())
@@ -2,24 +2,47 @@
 #   Implementation of RSA cryptography using samples of large numbers
 import random
 import sys
+import functools
+import hashlib
+import json
 import math
+import os
+import threading
+import time
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from itertools import compress
 from random import randrange
 
-def rabinMiller(n, k=10):
+try:
+    import numpy as np
+except ImportError:
+    #numpy is optional, the sieve falls back to a bytearray
+    np = None
+
+try:
+    import gmpy2
+except ImportError:
+    #gmpy2 is optional, builtin ints are used without it
+    gmpy2 = None
+
+def rabinMiller(n, k=10, bases=None):
+    #runs k-1 random rounds, or exactly the given bases when bases is passed
     if n == 2:
             return True
     if not n & 1:
             return False
 
     def check(a, s, d, n):
-            x = pow(a, d, n)
+            x = powmod(a, d, n)
             if x == 1:
                     return True
-            for i in range(1, s - 1):
+            #x has to hit n-1 somewhere in a^d, a^2d, ... a^(2^(s-1))d
+            for i in range(s - 1):
                     if x == n - 1:
                             return True
-                    x = pow(x, 2, n)
+                    x = powmod(x, 2, n)
             return x == n - 1
 
     s = 0
@@ -29,50 +52,246 @@ def rabinMiller(n, k=10):
             d >>= 1
             s += 1
 
-    for i in range(1, k):
-            a = randrange(2, n - 1)
+    if bases is None:
+            bases = [randrange(2, n - 1) for i in range(1, k)]
+    for a in bases:
+            a %= n
+            if a == 0:
+                    continue
             if not check(a, s, d, n):
                     return False
     return True
 
+#the first 13 primes as Miller-Rabin bases give the right answer for every n below this
+#(Sorenson and Webster 2015), so no randomness is needed there
+deterministicLimit = 3317044064679887385961981
+deterministicBases = [2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41]
+
+#None means deterministic bases / Baillie-PSW, a number means that many random
+#Miller-Rabin rounds (error at most 4^-rounds) for callers that want a stated bound
+primalityRounds = None
+
+def jacobi(a, n):
+    #Jacobi symbol (a/n) for odd positive n
+    a %= n
+    result = 1
+    while a != 0:
+        while a % 2 == 0:
+            a //= 2
+            if n % 8 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+def strongLucas(n):
+    """Strong Lucas probable prime test with Selfridge's parameters (P=1, Q=(1-D)/4)"""
+    if math.isqrt(n) ** 2 == n:
+        return False
+    #first D in 5, -7, 9, -11, ... with (D/n) = -1
+    D = 5
+    while True:
+        j = jacobi(D, n)
+        if j == -1:
+            break
+        if j == 0 and abs(D) != n:
+            return False
+        D = -(D + 2) if D > 0 else -D + 2
+    Q = (1 - D) // 4
+
+    def half(x):
+        #x/2 mod n, n is odd
+        return (x + n if x & 1 else x) // 2 % n
+
+    d = n + 1
+    s = 0
+    while d % 2 == 0:
+        d >>= 1
+        s += 1
+
+    #U_1 = 1, V_1 = P = 1, then walk the bits of d doubling (and adding one)
+    U, V, Qk = 1, 1, Q % n
+    for bit in bin(d)[3:]:
+        U, V = U * V % n, (V * V - 2 * Qk) % n
+        Qk = Qk * Qk % n
+        if bit == '1':
+            U, V = half(U + V), half(D * U + V)
+            Qk = Qk * Q % n
+    if U == 0 or V == 0:
+        return True
+    for r in range(1, s):
+        V = (V * V - 2 * Qk) % n
+        Qk = Qk * Qk % n
+        if V == 0:
+            return True
+    return False
+
+def bailliePSW(n):
+    #Miller-Rabin base 2 plus a strong Lucas test, no composite is known to pass both
+    return rabinMiller(n, bases=[2]) and strongLucas(n)
+
+def primalityTest(n, rounds=None):
+    """Returns True if n is (probably) prime.
+    rounds=None: deterministic bases below deterministicLimit, Baillie-PSW above it.
+    rounds=k: k random Miller-Rabin rounds"""
+    if n < 2:
+        return False
+    if n < 4:
+        return True
+    if rounds is not None:
+        if n < 5:
+            return n != 4
+        return rabinMiller(n, rounds + 1)
+    if n < deterministicLimit:
+        return rabinMiller(n, bases=deterministicBases)
+    return bailliePSW(n)
+
+#lowPrimes is all primes (sans 2, which is covered by the bitwise and operator)
+#under smallPrimeLimit. taking n modulo each lowPrime allows us to remove a huge chunk
+#of composite numbers from our potential pool without resorting to Rabin-Miller
+#it is filled in from the sieve below, change it with setSmallPrimeLimit
+smallPrimeLimit = 1000
+lowPrimes = []
+
+#the window sieve has its own, much bigger table. crossing off costs one slice
+#per prime whatever the window holds, so many more primes are cheap there
+#while every extra prime in lowPrimes is one more % for isPrime. change it
+#with setSievePrimeLimit
+sievePrimeLimit = 1 << 16
+sievePrimes = []
+
+#how many candidates each stage of the prime search threw away
+#per process, so counts from parallel workers stay in the workers
+primeStats = {
+    'candidates': 0,               #numbers looked at
+    'sieve_rejected': 0,           #crossed off by the window sieve
+    'trial_division_rejected': 0,  #caught by the lowPrimes loop in isPrime
+    'rabin_miller_calls': 0,       #candidates that cost modexps
+    'rabin_miller_rejected': 0,
+    'primes_found': 0,
+}
+
+def resetPrimeStats():
+    for key in primeStats:
+        primeStats[key] = 0
+
 def isPrime(n):
-     #lowPrimes is all primes (sans 2, which is covered by the bitwise and operator)
-     #under 1000. taking n modulo each lowPrime allows us to remove a huge chunk
-     #of composite numbers from our potential pool without resorting to Rabin-Miller
-     lowPrimes =   [3,5,7,11,13,17,19,23,29,31,37,41,43,47,53,59,61,67,71,73,79,83,89,97
-                   ,101,103,107,109,113,127,131,137,139,149,151,157,163,167,173,179
-                   ,181,191,193,197,199,211,223,227,229,233,239,241,251,257,263,269
-                   ,271,277,281,283,293,307,311,313,317,331,337,347,349,353,359,367
-                   ,373,379,383,389,397,401,409,419,421,431,433,439,443,449,457,461
-                   ,463,467,479,487,491,499,503,509,521,523,541,547,557,563,569,571
-                   ,577,587,593,599,601,607,613,617,619,631,641,643,647,653,659,661
-                   ,673,677,683,691,701,709,719,727,733,739,743,751,757,761,769,773
-                   ,787,797,809,811,821,823,827,829,839,853,857,859,863,877,881,883
-                   ,887,907,911,919,929,937,941,947,953,967,971,977,983,991,997]
      if (n >= 3):
          if (n&1 != 0):
              for p in lowPrimes:
                  if (n == p):
                     return True
                  if (n % p == 0):
+                     primeStats['trial_division_rejected'] += 1
                      return False
-             return rabinMiller(n)
+             primeStats['rabin_miller_calls'] += 1
+             if primalityTest(n, primalityRounds):
+                 return True
+             primeStats['rabin_miller_rejected'] += 1
      return False
 
-def generateLargePrime(k):
+def sieveWindow(start, window, primes=None):
+    """Returns the numbers start, start+2, ... (window of them) that no small prime divides.
+    start has to be odd and bigger than every small prime.
+    Each prime crosses off its multiples with one slice assignment
+    instead of a % per candidate"""
+    primes = sievePrimes if primes is None else primes
+    alive = bytearray(b'\x01') * window
+    for p in primes:
+        #index i is start + 2i, it is divisible by p when 2i = -start (mod p)
+        i = (-start * ((p + 1) // 2)) % p
+        if i < window:
+            alive[i::p] = bytes((window - 1 - i) // p + 1)
+    survivors = [start + 2 * i for i in range(window) if alive[i]]
+    primeStats['candidates'] += window
+    primeStats['sieve_rejected'] += window - len(survivors)
+    return survivors
+
+def sieveCandidates(k, window=None, rng=random):
+    #endless stream of k bit odd numbers that made it through the sieve
+    #one random odd start, then walk window after window from there
+    window = window or max(64, k)
+    low, high = 2**(k-1), 2**k
+    start = rng.randrange(low, high) | 1
+    while True:
+        if start + 2 * window > high:
+            start = rng.randrange(low, high - 2 * window) | 1
+        for n in sieveWindow(start, window):
+            yield n
+        start += 2 * window
+
+def generateLargePrime(k, sieve=True):
      #k is the desired bit length
-     r = 100*(math.log(k,2)+1) #number of attempts max
-     r_ = r
-     while r>0:
+     #keeps drawing until it finds a prime, primes near 2^k show up about once
+     #every k*ln(2) numbers so this always ends (there used to be a fixed budget
+     #that returned a failure string which then got multiplied into n)
+     if sieve and 2**(k-1) > sievePrimes[-1] and 2**k > 4 * max(64, k):
+         for n in sieveCandidates(k):
+             primeStats['rabin_miller_calls'] += 1
+             if primalityTest(n, primalityRounds):
+                 primeStats['primes_found'] += 1
+                 return n
+             primeStats['rabin_miller_rejected'] += 1
+     while True:
         #randrange is mersenne twister and is completely deterministic
         #unusable for serious crypto purposes
          n = random.randrange(2**(k-1),2**(k))
-         r -= 1
+         primeStats['candidates'] += 1
          if isPrime(n) == True:
+             primeStats['primes_found'] += 1
              return n
 
-     str_failure = "Failure after" + str(r_) + "tries."
-     return str_failure
+def _searchBatch(k, count, seed):
+    #worker side of the parallel search: sieve count odd numbers from a random start
+    #each worker gets its own seed so they don't all try the same numbers
+    rng = random.Random(seed)
+    if 2**(k-1) <= sievePrimes[-1] or 2**k <= 4 * count:
+        for i in range(count):
+            n = rng.randrange(2**(k-1), 2**k) | 1
+            if isPrime(n):
+                return n
+        return None
+    start = rng.randrange(2**(k-1), 2**k - 2 * count) | 1
+    for n in sieveWindow(start, count):
+        if primalityTest(n, primalityRounds):
+            return n
+    return None
+
+def parallelPrimes(k, count=1, executor=None, workers=None, batch=256):
+    """Returns a list of count distinct k bit primes, searched for on a process pool.
+    Small sieved windows of candidates keep every core busy, the first primes that
+    come back win and the batches still waiting are cancelled.
+    Pass an executor to reuse a pool, otherwise one is made and shut down here"""
+    own = executor is None
+    if own:
+        executor = ProcessPoolExecutor(workers)
+    workers = workers or os.cpu_count() or 1
+    found = []
+    pending = set()
+    try:
+        for i in range(2 * workers):
+            pending.add(executor.submit(_searchBatch, k, batch, random.getrandbits(64)))
+        while True:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                n = future.result()
+                if n is not None and n not in found:
+                    found.append(n)
+                    if len(found) == count:
+                        return found
+                pending.add(executor.submit(_searchBatch, k, batch, random.getrandbits(64)))
+    finally:
+        for future in pending:
+            future.cancel()
+        if own:
+            #running batches are short so this only waits for at most one of them
+            executor.shutdown(wait=True, cancel_futures=True)
+
+def generateLargePrimeParallel(k, executor=None, workers=None):
+    #same as generateLargePrime but spread across all cores
+    return parallelPrimes(k, 1, executor, workers)[0]
 
 
 def gcd(a, b):
@@ -112,20 +331,108 @@ def multiplicative_inverse(a, b):
 def rwh_primes2(n):
     # https://stackoverflow.com/questions/2068372/fastest-way-to-list-all-primes-below-n-in-python/3035188#3035188
     """ Input n>=6, Returns a list of primes, 2 <= p < n """
+    if n < 6:
+        return [p for p in (2, 3, 5) if p < n]
+    if np is not None:
+        return _rwh_primes2_numpy(n)
     correction = (n%6>1)
     n = {0:n,1:n-1,2:n+4,3:n+3,4:n+2,5:n+1}[n%6]
-    sieve = [True] * (n/3)
-    sieve[0] = False
-    for i in xrange(int(n**0.5)/3+1):
+    sieve = bytearray(b'\x01') * (n//3)
+    sieve[0] = 0
+    for i in range(math.isqrt(n)//3+1):
       if sieve[i]:
         k=3*i+1|1
-        sieve[      ((k*k)/3)      ::2*k]=[False]*((n/6-(k*k)/6-1)/k+1)
-        sieve[(k*k+4*k-2*k*(i&1))/3::2*k]=[False]*((n/6-(k*k+4*k-2*k*(i&1))/6-1)/k+1)
-    return [2,3] + [3*i+1|1 for i in xrange(1,n/3-correction) if sieve[i]]
+        sieve[      ((k*k)//3)      ::2*k]=bytes((n//6-(k*k)//6-1)//k+1)
+        sieve[(k*k+4*k-2*k*(i&1))//3::2*k]=bytes((n//6-(k*k+4*k-2*k*(i&1))//6-1)//k+1)
+    return [2,3] + [3*i+1|1 for i in range(1,n//3-correction) if sieve[i]]
+
+def _rwh_primes2_numpy(n):
+    #same wheel as rwh_primes2 but the crossing off happens in numpy
+    sieve = np.ones(n//3 + (n%6==2), dtype=bool)
+    for i in range(1, math.isqrt(n)//3+1):
+      if sieve[i]:
+        k=3*i+1|1
+        sieve[       k*k//3     ::2*k] = False
+        sieve[k*(k-2*(i&1)+4)//3::2*k] = False
+    return [2,3] + ((3*np.nonzero(sieve)[0][1:]+1)|1).tolist()
+
+def segmentedPrimes(low, high, segment=1 << 20):
+    """Yields the primes low <= p < high one segment at a time.
+    Only the base primes up to sqrt(high) and one segment of flags
+    are ever in memory, so this works up to 10^9 and past it"""
+    low = max(low, 2)
+    base = smallPrimes(math.isqrt(high) + 1)
+    for seg_low in range(low, high, segment):
+        seg_high = min(seg_low + segment, high)
+        flags = bytearray(b'\x01') * (seg_high - seg_low)
+        for p in base:
+            if p * p >= seg_high:
+                break
+            #first multiple of p in the segment, but never p itself
+            first = max(p * p, (seg_low + p - 1) // p * p) - seg_low
+            flags[first::p] = bytes(len(range(first, len(flags), p)))
+        yield from compress(range(seg_low, seg_high), flags)
+
+#sieves already done in this process, keyed by limit
+_primeTables = {}
+
+def smallPrimes(limit):
+    """Returns a tuple of all primes below limit, cached per process"""
+    if limit not in _primeTables:
+        _primeTables[limit] = tuple(rwh_primes2(limit))
+    return _primeTables[limit]
+
+def setSmallPrimeLimit(limit):
+    #bigger tables sieve out more candidates but make isPrime's trial division longer
+    global smallPrimeLimit, lowPrimes
+    smallPrimeLimit = limit
+    lowPrimes = list(smallPrimes(limit)[1:])
+
+def setSievePrimeLimit(limit):
+    #primes the window sieve crosses off with, candidates must be bigger than all of them
+    global sievePrimeLimit, sievePrimes
+    sievePrimeLimit = limit
+    sievePrimes = list(smallPrimes(limit)[1:])
+
+setSmallPrimeLimit(smallPrimeLimit)
+setSievePrimeLimit(sievePrimeLimit)
+
+#big integer backend: builtin ints unless gmpy2 is installed,
+#karatsubaCutoff is None (never use the pure python Karatsuba) until
+#calibrateMultiply measures a size where it actually wins on this machine
+calibrationFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rsa_calibration.json')
+karatsubaCutoff = None
+backend = 'builtin'
+
+def setBackend(name):
+    """Picks 'builtin' or 'gmpy2' for multiply, powmod and invert"""
+    global backend
+    if name == 'gmpy2' and gmpy2 is None:
+        raise ValueError('gmpy2 is not installed')
+    if name not in ('builtin', 'gmpy2'):
+        raise ValueError('unknown backend ' + repr(name))
+    backend = name
+
+def powmod(b, e, m):
+    if backend == 'gmpy2':
+        return int(gmpy2.powmod(b, e, m))
+    return pow(b, e, m)
+
+def invert(a, m):
+    #a^-1 mod m
+    if backend == 'gmpy2':
+        return int(gmpy2.invert(a, m))
+    return multiplicative_inverse(a, m)
 
 def multiply(x, y):
-    _CUTOFF = 1536
-    if x.bit_length() <= _CUTOFF or y.bit_length() <= _CUTOFF:  # Base case
+    if backend == 'gmpy2':
+        return int(gmpy2.mpz(x) * y)
+    if karatsubaCutoff is None:
+        return x * y
+    return karatsuba(x, y, karatsubaCutoff)
+
+def karatsuba(x, y, cutoff):
+    if x.bit_length() <= cutoff or y.bit_length() <= cutoff:  # Base case
         return x * y
     else:
         n = max(x.bit_length(), y.bit_length())
@@ -136,16 +443,152 @@ def multiply(x, y):
         xhigh = x >> half
         yhigh = y >> half
 
-        a = multiply(xhigh, yhigh)
-        b = multiply(xlow + xhigh, ylow + yhigh)
-        c = multiply(xlow, ylow)
+        a = karatsuba(xhigh, yhigh, cutoff)
+        b = karatsuba(xlow + xhigh, ylow + yhigh, cutoff)
+        c = karatsuba(xlow, ylow, cutoff)
         d = b - a - c
         return (((a << half) + d) << half) + c
 
-def generate_keypair(keySize=8):
-    p = generateLargePrime(keySize)
+def _bestTime(func, pairs, rounds=5):
+    #best of a few rounds so one slow run (another process, GC) doesn't decide it
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        for x, y in pairs:
+            func(x, y)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+def calibrateMultiply(maxBits=1 << 17, repeat=20, save=True):
+    """Finds the smallest size where one level of Karatsuba beats builtin *
+    by at least 10% there and at the next size up, and stores it as
+    karatsubaCutoff (None if it never does, which is the usual answer since
+    CPython already uses Karatsuba internally).
+    The result is written to calibrationFile so later runs just load it"""
+    global karatsubaCutoff
+    cutoff = None
+    wins = []
+    bits = 512
+    while bits <= maxBits:
+        pairs = [(random.getrandbits(bits), random.getrandbits(bits)) for i in range(repeat)]
+        builtin = _bestTime(lambda x, y: x * y, pairs)
+        split = _bestTime(lambda x, y: karatsuba(x, y, bits - 1), pairs)
+        wins.append((bits, split < 0.9 * builtin))
+        if len(wins) >= 2 and wins[-2][1] and wins[-1][1]:
+            cutoff = wins[-2][0] // 2
+            break
+        bits *= 2
+    karatsubaCutoff = cutoff
+    if save:
+        with open(calibrationFile, 'w') as f:
+            json.dump({'karatsubaCutoff': cutoff}, f)
+    return cutoff
+
+def loadCalibration():
+    global karatsubaCutoff
+    try:
+        with open(calibrationFile) as f:
+            karatsubaCutoff = json.load(f)['karatsubaCutoff']
+    except (OSError, ValueError, KeyError):
+        pass
+
+loadCalibration()
+if gmpy2 is not None:
+    setBackend('gmpy2')
+
+class PrivateKey:
+    """Private key that keeps p and q so decryption can use the
+    Chinese Remainder Theorem: two half size exponentiations instead of one full one"""
+
+    def __init__(self, d, n, p, q, dP=None, dQ=None, qInv=None):
+        #dP, dQ and qInv can be passed in when they were saved earlier (see rsa_keystore.py)
+        self.d = d
+        self.n = n
+        self.p = p
+        self.q = q
+        self.dP = d % (p - 1) if dP is None else dP
+        self.dQ = d % (q - 1) if dQ is None else dQ
+        self.qInv = invert(q, p) if qInv is None else qInv
+
+    def power(self, c):
+        #c^d mod n computed as c^dP mod p and c^dQ mod q, then recombined (Garner's formula)
+        m1 = powmod(c, self.dP, self.p)
+        m2 = powmod(c, self.dQ, self.q)
+        h = (self.qInv * (m1 - m2)) % self.p
+        return m2 + h * self.q
+
+    def __int__(self):
+        return self.d
+
+    def __repr__(self):
+        return 'PrivateKey(d=%d, n=%d)' % (self.d, self.n)
+
+class KeyPair(tuple):
+    """The (e, d, n) tuple returned by generate_keypair.
+    Indexing and unpacking work like before, keys.private is the CRT PrivateKey"""
+
+    def __new__(cls, e, d, n, p, q, dP=None, dQ=None, qInv=None):
+        keys = super().__new__(cls, (e, d, n))
+        keys.private = PrivateKey(d, n, p, q, dP, dQ, qInv)
+        return keys
+
+    def __getnewargs__(self):
+        #lets pickle rebuild the private part too
+        k = self.private
+        return (self[0], self[1], self[2], k.p, k.q, k.dP, k.dQ, k.qInv)
+
+    @property
+    def e(self):
+        return self[0]
+
+    @property
+    def d(self):
+        return self[1]
+
+    @property
+    def n(self):
+        return self[2]
+
+def _power(key, c, n):
+    #key is either a plain exponent or a PrivateKey that can use CRT
+    if isinstance(key, PrivateKey):
+        return key.power(c)
+    return powmod(c, key, n)
+
+#optional pool of ready primes (a PrimeReservoir from rsa_reservoir.py),
+#generate_keypair takes from it first and only searches when it is empty
+primeReservoir = None
+
+#the usual fixed public exponent: prime, and only 17 multiplications per encryption
+DEFAULT_EXPONENT = 65537
+
+def takePrime(k, e=None):
+    #with e given, skip primes where p-1 shares a factor with e (d wouldn't exist)
+    while True:
+        p = None
+        if primeReservoir is not None:
+            p = primeReservoir.take(k)
+        if p is None:
+            p = generateLargePrime(k)
+        if e is None or gcd(e, p - 1) == 1:
+            return p
+
+def generate_keypair(keySize=8, parallel=False, workers=None, publicExponent=DEFAULT_EXPONENT):
+    #publicExponent=None picks a random e in [1, phi) like the original version
+    e = publicExponent
+    if parallel:
+        #search for p and q at the same time on a process pool
+        primes = []
+        while len(primes) < 2:
+            for p in parallelPrimes(keySize, 2, workers=workers):
+                if (e is None or gcd(e, p - 1) == 1) and p not in primes and len(primes) < 2:
+                    primes.append(p)
+        p, q = primes
+    else:
+        p = takePrime(keySize, e)
+        q = takePrime(keySize, e)
     print(p)
-    q = generateLargePrime(keySize)
     print(q)
 
     if p == q:
@@ -157,36 +600,265 @@ def generate_keypair(keySize=8):
     #Phi is the totient of n
     phi = multiply((p-1),(q-1))
 
-    #Choose an integer e such that e and phi(n) are coprime
-    e = random.randrange(1, phi)
-
-    #Use Euclid's Algorithm to verify that e and phi(n) are comprime
-    g = gcd(e, phi)
-
-    while g != 1:
+    if e is None:
+        #Choose an integer e such that e and phi(n) are coprime
         e = random.randrange(1, phi)
+
+        #Use Euclid's Algorithm to verify that e and phi(n) are comprime
         g = gcd(e, phi)
 
+        while g != 1:
+            e = random.randrange(1, phi)
+            g = gcd(e, phi)
+
     #Use Extended Euclid's Algorithm to generate the private key
-    d = multiplicative_inverse(e, phi)
+    d = invert(e, phi)
 
     #Return public and private keypair
     #Public key is (e, n) and private key is (d, n)
-    return e, d, n
+    #keys.private holds the same d with p and q kept for CRT decryption
+    return KeyPair(e, d, n, p, q)
 
 def encrypt(key, n,  plaintext):
    #Convert each letter in the plaintext to numbers based on the character using a^b mod m
-    cipher = [(ord(char) ** key) % n for char in plaintext]
+   #this is the per-character compatibility mode, use encrypt_bytes for real data
+    cipher = [powmod(ord(char), key, n) for char in plaintext]
     #Return the array of bytes
     return cipher
 
 def decrypt(key, n, ciphertext):
     #Generate the plaintext based on the ciphertext and key using a^b mod m
+    #key can be a plain integer or a PrivateKey (keys.private) for the faster CRT path
  
-  plain = [chr((int(char) ** key) % n) for char in ciphertext]
+  plain = [chr(_power(key, int(char), n)) for char in ciphertext]
     #Return the array of bytes as a string
   return ''.join(plain)
 
+def key_id(n):
+    #short fingerprint of a modulus so files and keystores can say which key they need
+    return hashlib.sha256(n.to_bytes((n.bit_length() + 7) // 8, 'big')).hexdigest()[:16]
+
+def block_sizes(n):
+    """Returns (plain_size, cipher_size) in bytes for a modulus n.
+    A plaintext block is the largest whole number of bytes that is always < n,
+    a ciphertext block is wide enough to hold any value mod n"""
+    plain_size = (n.bit_length() - 1) // 8
+    cipher_size = (n.bit_length() + 7) // 8
+    if plain_size < 1:
+        raise ValueError('modulus is too small for block mode, use a bigger keySize')
+    return plain_size, cipher_size
+
+def pad_bytes(data, plain_size):
+    #ISO 7816-4 style padding: a 0x80 marker then zeros up to a whole block
+    #so the real length can always be recovered after decryption
+    fill = plain_size - (len(data) % plain_size)
+    return bytes(data) + b'\x80' + bytes(fill - 1)
+
+def unpad_bytes(data):
+    end = bytes(data).rstrip(b'\x00')
+    if not end or end[-1] != 0x80:
+        raise ValueError('bad padding, wrong key or corrupt ciphertext')
+    return end[:-1]
+
+def _encrypt_blocks(key, n, data, plain_size, cipher_size):
+    #data is a whole number of plaintext blocks
+    out = bytearray()
+    for i in range(0, len(data), plain_size):
+        m = int.from_bytes(data[i:i + plain_size], 'big')
+        out += powmod(m, key, n).to_bytes(cipher_size, 'big')
+    return bytes(out)
+
+def _decrypt_blocks(key, n, data, plain_size, cipher_size):
+    #data is a whole number of ciphertext blocks
+    view = memoryview(data)
+    out = bytearray()
+    for i in range(0, len(view), cipher_size):
+        c = int.from_bytes(view[i:i + cipher_size], 'big')
+        try:
+            out += _power(key, c, n).to_bytes(plain_size, 'big')
+        except OverflowError:
+            raise ValueError('block does not fit, wrong key or corrupt ciphertext') from None
+    return out
+
+def encrypt_bytes(key, n, data):
+    """Encrypts bytes with one pow(m, key, n) per block instead of per character.
+    Returns the ciphertext as bytes made of fixed width big-endian blocks"""
+    plain_size, cipher_size = block_sizes(n)
+    return _encrypt_blocks(key, n, pad_bytes(data, plain_size), plain_size, cipher_size)
+
+def decrypt_bytes(key, n, ciphertext):
+    """Reverses encrypt_bytes and returns the original bytes.
+    Pass keys.private as the key to decrypt with CRT"""
+    plain_size, cipher_size = block_sizes(n)
+    if len(ciphertext) % cipher_size != 0:
+        raise ValueError('ciphertext length is not a whole number of blocks')
+    return unpad_bytes(_decrypt_blocks(key, n, ciphertext, plain_size, cipher_size))
+
+def read_chunks(f, size=1 << 16):
+    #yields size bytes at a time from a binary file until it runs out
+    while True:
+        chunk = f.read(size)
+        if not chunk:
+            return
+        yield chunk
+
+def encrypt_stream(key, n, chunks):
+    """Generator version of encrypt_bytes: takes an iterable of byte chunks of any
+    size and yields ciphertext as soon as whole blocks are available.
+    Only one chunk plus one partial block is held at a time.
+    The output is exactly what encrypt_bytes gives for the joined input"""
+    plain_size, cipher_size = block_sizes(n)
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        whole = len(buffer) // plain_size * plain_size
+        if whole:
+            yield _encrypt_blocks(key, n, bytes(buffer[:whole]), plain_size, cipher_size)
+            del buffer[:whole]
+    yield _encrypt_blocks(key, n, pad_bytes(buffer, plain_size), plain_size, cipher_size)
+
+def decrypt_stream(key, n, chunks):
+    """Generator version of decrypt_bytes. The last block is held back
+    until the input ends because it carries the padding"""
+    plain_size, cipher_size = block_sizes(n)
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer += chunk
+        #leave between 1 and cipher_size bytes behind
+        ready = (len(buffer) - 1) // cipher_size * cipher_size
+        if ready > 0:
+            yield bytes(_decrypt_blocks(key, n, bytes(buffer[:ready]), plain_size, cipher_size))
+            del buffer[:ready]
+    if len(buffer) != cipher_size:
+        raise ValueError('ciphertext length is not a whole number of blocks')
+    yield unpad_bytes(_decrypt_blocks(key, n, buffer, plain_size, cipher_size))
+
+#key for the batch decrypt workers, sent once per process by the pool initializer
+_batchKey = None
+
+def _initBatchWorker(key, n):
+    global _batchKey
+    _batchKey = (key, n)
+
+def _decryptOne(key, n, ciphertext):
+    #bytes come from encrypt_bytes, lists of numbers from the per-character encrypt
+    if isinstance(ciphertext, (bytes, bytearray, memoryview)):
+        return decrypt_bytes(key, n, ciphertext)
+    return decrypt(key, n, ciphertext)
+
+def _decryptChunk(chunk):
+    key, n = _batchKey
+    return [_decryptOne(key, n, ciphertext) for ciphertext in chunk]
+
+def decrypt_batch(key, n, ciphertexts, workers=None, chunksize=64):
+    """Decrypts many independent ciphertexts under one key on a process pool.
+    The key goes to each worker once, ciphertexts go in chunks, and the
+    plaintexts are yielded in the same order as the input as soon as they're ready.
+    Only a few chunks per worker are in flight so any length of input works"""
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers, initializer=_initBatchWorker, initargs=(key, n)) as executor:
+        inflight = deque()
+        chunk = []
+        for ciphertext in ciphertexts:
+            chunk.append(ciphertext)
+            if len(chunk) == chunksize:
+                inflight.append(executor.submit(_decryptChunk, chunk))
+                chunk = []
+                #wait on the oldest chunk once enough work is queued
+                while len(inflight) >= 4 * workers:
+                    yield from inflight.popleft().result()
+        if chunk:
+            inflight.append(executor.submit(_decryptChunk, chunk))
+        while inflight:
+            yield from inflight.popleft().result()
+
+#optional tracing of where keygen time goes. enableTracing swaps the module's
+#functions for timed wrappers and disableTracing puts the originals back,
+#so when it is off nothing extra runs at all
+TRACED_STAGES = ['generate_keypair', 'takePrime', 'generateLargePrime', 'sieveWindow',
+                 'isPrime', 'primalityTest', 'gcd', 'invert']
+traceStats = {}
+_untraced = {}
+_traceLocal = threading.local()
+#keygen latencies kept for percentiles, oldest dropped past this many
+traceSampleLimit = 10000
+
+def _newTraceRecord():
+    return {'calls': 0, 'seconds': 0.0, 'self_seconds': 0.0}
+
+def resetTracing():
+    traceStats.clear()
+    for name in TRACED_STAGES:
+        traceStats[name] = _newTraceRecord()
+    traceStats['generate_keypair']['samples'] = deque(maxlen=traceSampleLimit)
+
+def _traced(name, func):
+    #wraps copies __qualname__ and __module__ too, so a traced function still
+    #pickles by name (the reservoir and parallel search send them to workers)
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        #self_seconds leaves out time spent in other traced stages called from here,
+        #so isPrime's self time is its trial division
+        stack = getattr(_traceLocal, 'stack', None)
+        if stack is None:
+            stack = _traceLocal.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = stack.pop()
+            record = traceStats[name]
+            record['calls'] += 1
+            record['seconds'] += elapsed
+            record['self_seconds'] += elapsed - children
+            if 'samples' in record:
+                record['samples'].append(elapsed)
+            if stack:
+                stack[-1] += elapsed
+    return wrapper
+
+def enableTracing():
+    if _untraced:
+        return
+    if not traceStats:
+        resetTracing()
+    module = globals()
+    for name in TRACED_STAGES:
+        _untraced[name] = module[name]
+        module[name] = _traced(name, module[name])
+
+def disableTracing():
+    globals().update(_untraced)
+    _untraced.clear()
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def traceReport():
+    """Everything tracing collected as a plain dict (JSON friendly)"""
+    report = {'enabled': bool(_untraced), 'stages': {}, 'primeStats': dict(primeStats)}
+    for name, record in traceStats.items():
+        stage = {key: value for key, value in record.items() if key != 'samples'}
+        if 'samples' in record:
+            ordered = sorted(record['samples'])
+            stage['latency'] = {'count': len(ordered), 'p50': _percentile(ordered, 0.5),
+                                'p90': _percentile(ordered, 0.9), 'p99': _percentile(ordered, 0.99),
+                                'max': ordered[-1] if ordered else None}
+        report['stages'][name] = stage
+    return report
+
+def dumpTrace(f):
+    #f is an open text file or a path
+    if isinstance(f, str):
+        with open(f, 'w') as out:
+            json.dump(traceReport(), out, indent=2)
+    else:
+        json.dump(traceReport(), f, indent=2)
+
 def print_formatted_message(msg):
   print(''.join(map(lambda x: str(x), msg)))
   return
@@ -195,19 +867,27 @@ if __name__ == '__main__':
     '''
     Detect if the script is being run directly by the user
     '''
-    print("RSA Encrypter/ Decrypter")
+    import rsa_keystore
 
-    print("Generating your public/private keypairs now . . .")
-    keys= generate_keypair()
-    #keys[0]
-    print("Public key: ", keys[0],"Private key: ", keys[1],"Modulus: ",keys[2]," Record these and save them for later.")
+    print("RSA Encrypter/ Decrypter")
 
     message = str(sys.argv[1])
 
+    store = rsa_keystore.default_keystore()
+    if len(sys.argv) > 2:
+        #reuse a saved keypair: python rsa.py "message" <key id>
+        keys = store.load(sys.argv[2])
+        print("Using saved keypair", sys.argv[2])
+    else:
+        print("Generating your public/private keypairs now . . .")
+        keys= generate_keypair()
+        print("Public key: ", keys[0],"Private key: ", keys[1],"Modulus: ",keys[2])
+        print("Saved as key id", store.save(keys), "in", store.path)
+
     encrypted_msg = encrypt(keys[1],keys[2], message)
     print (type(encrypted_msg))
     print("Your encrypted message is: ")
     print(''.join(map(lambda x: str(x), encrypted_msg)))
     #print("Decrypting message with public key ", public ,"...")
     print("Your message is:")
-    print(decrypt(keys[0], keys[2], encrypted_msg))
\ No newline at end of file
+    print(decrypt(keys[0], keys[2], encrypted_msg))
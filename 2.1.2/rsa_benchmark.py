@@ -0,0 +1,157 @@
+#   a212_rsa_benchmark.py
+#   Times the parts of rsa.py and writes the results as JSON
+#   no input() or display needed, e.g.
+#   python rsa_benchmark.py --sizes 512 1024 --output bench.json
+import argparse
+import contextlib
+import io
+import json
+import platform
+import random
+import time
+
+import rsa as rsa
+
+
+def timed(func, *args):
+    #returns (result, seconds) for one call
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def quiet_keypair(keySize):
+    #generate_keypair prints p and q, keep that out of the benchmark output
+    with contextlib.redirect_stdout(io.StringIO()):
+        return rsa.generate_keypair(keySize)
+
+
+def bench_keygen(sizes, repeat):
+    results = {}
+    for size in sizes:
+        times = []
+        for i in range(repeat):
+            keys, seconds = timed(quiet_keypair, size)
+            times.append(seconds)
+        results[str(size)] = {"runs": times, "mean": sum(times) / len(times), "best": min(times)}
+    return results
+
+
+def bench_cipher(keys, char_payload, block_payload):
+    e, d, n = keys
+    text = "".join(random.choice("abcdefghijklmnopqrstuvwxyz ") for i in range(char_payload))
+    data = random.randbytes(block_payload)
+
+    cipher, enc_char = timed(rsa.encrypt, e, n, text)
+    plain, dec_char = timed(rsa.decrypt, d, n, cipher)
+    assert plain == text
+
+    cipher, enc_block = timed(rsa.encrypt_bytes, e, n, data)
+    plain, dec_block = timed(rsa.decrypt_bytes, d, n, cipher)
+    assert plain == data
+    plain, dec_crt = timed(rsa.decrypt_bytes, keys.private, n, cipher)
+    assert plain == data
+
+    return {
+        "per_char": {"bytes": char_payload,
+                     "encrypt_bytes_per_s": char_payload / enc_char,
+                     "decrypt_bytes_per_s": char_payload / dec_char},
+        "block": {"bytes": block_payload,
+                  "encrypt_bytes_per_s": block_payload / enc_block,
+                  "decrypt_bytes_per_s": block_payload / dec_block,
+                  "decrypt_crt_bytes_per_s": block_payload / dec_crt},
+    }
+
+
+def _time_pairs(func, pairs):
+    start = time.perf_counter()
+    for x, y in pairs:
+        func(x, y)
+    return (time.perf_counter() - start) / len(pairs)
+
+
+def bench_multiply(sizes, repeat, karatsuba_cutoff):
+    #multiply_s is whatever rsa.multiply is set up to do (builtin, gmpy2 or the
+    #calibrated karatsubaCutoff), karatsuba_s is pure Karatsuba at karatsuba_cutoff bits
+    results = {}
+    for size in sizes:
+        pairs = [(random.getrandbits(size), random.getrandbits(size)) for i in range(repeat)]
+        builtin = _time_pairs(lambda x, y: x * y, pairs)
+        configured = _time_pairs(rsa.multiply, pairs)
+        karatsuba = _time_pairs(lambda x, y: rsa.karatsuba(x, y, karatsuba_cutoff), pairs)
+        results[str(size)] = {"builtin_s": builtin,
+                              "multiply_s": configured,
+                              "multiply_ratio": configured / builtin if builtin else None,
+                              "karatsuba_s": karatsuba,
+                              "karatsuba_ratio": karatsuba / builtin if builtin else None}
+    return results
+
+
+def bench_isprime(sizes, count):
+    #splits isPrime's cost into the trial division loop and the Miller-Rabin part
+    results = {}
+    for size in sizes:
+        candidates = [random.randrange(2**(size-1), 2**size) | 1 for i in range(count)]
+        trial = 0.0
+        miller = 0.0
+        survivors = 0
+        primes = 0
+        for n in candidates:
+            start = time.perf_counter()
+            passed = all(n % p for p in rsa.lowPrimes)
+            middle = time.perf_counter()
+            trial += middle - start
+            if passed:
+                survivors += 1
+                if rsa.primalityTest(n, rsa.primalityRounds):
+                    primes += 1
+                miller += time.perf_counter() - middle
+        results[str(size)] = {"candidates": count, "survived_trial_division": survivors, "primes": primes,
+                              "trial_division_s": trial, "miller_rabin_s": miller}
+    return results
+
+
+def run(sizes, seed, repeat, char_payload, block_payload, karatsuba_cutoff=2048):
+    random.seed(seed)
+    results = {
+        "seed": seed,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "backend": rsa.backend,
+        "karatsuba_cutoff": rsa.karatsubaCutoff,
+        "bench_karatsuba_cutoff": karatsuba_cutoff,
+        "keygen": bench_keygen(sizes, repeat),
+    }
+    keys = quiet_keypair(sizes[0])
+    results["cipher"] = {"key_size": sizes[0]}
+    results["cipher"].update(bench_cipher(keys, char_payload, block_payload))
+    results["multiply"] = bench_multiply([size * 2 for size in sizes], 200, karatsuba_cutoff)
+    results["isprime"] = bench_isprime(sizes, 200)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark rsa.py and write JSON results")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048, 4096],
+                        help="key sizes in bits, the first one is also used for the cipher timings")
+    parser.add_argument("--seed", type=int, default=212)
+    parser.add_argument("--repeat", type=int, default=3, help="keypairs generated per size")
+    parser.add_argument("--char-payload", type=int, default=2048, help="characters for the per-char mode")
+    parser.add_argument("--block-payload", type=int, default=1 << 16, help="bytes for the block mode")
+    parser.add_argument("--karatsuba-cutoff", type=int, default=2048,
+                        help="cutoff in bits for the pure Karatsuba timing (rsa.multiply uses its own setting)")
+    parser.add_argument("--output", help="file to write, stdout if left out")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.seed, args.repeat, args.char_payload, args.block_payload,
+                  args.karatsuba_cutoff)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
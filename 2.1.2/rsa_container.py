@@ -0,0 +1,134 @@
+#   a212_rsa_container.py
+#   Binary file format for RSA ciphertext
+#
+#   header   magic, version, key id, block sizes, plaintext length,
+#            block count, where the index starts, blocks per index entry
+#   blocks   fixed width big-endian ciphertext blocks, back to back
+#   index    one 8 byte file offset for every segment_blocks blocks
+#
+#   A reader memory-maps the file and only touches the blocks it is asked for
+import mmap
+import struct
+
+import rsa as rsa
+
+MAGIC = b"RSAC"
+VERSION = 1
+HEADER = struct.Struct(">4sBx8sIIQQQI")
+OFFSET = struct.Struct(">Q")
+
+
+def write_container(target, e, n, chunks, segment_blocks=1024):
+    """Encrypts an iterable of byte chunks into target (a seekable binary file).
+    Blocks are written as they are made, the header is filled in at the end.
+    Returns the number of blocks written"""
+    plain_size, cipher_size = rsa.block_sizes(n)
+    start = target.tell()
+    target.write(bytes(HEADER.size))
+
+    length = 0
+
+    def counted(chunks):
+        nonlocal length
+        for chunk in chunks:
+            length += len(chunk)
+            yield chunk
+
+    index = []
+    blocks = 0
+    offset = start + HEADER.size
+    for piece in rsa.encrypt_stream(e, n, counted(chunks)):
+        #pieces are always whole blocks
+        for i in range(len(piece) // cipher_size):
+            if blocks % segment_blocks == 0:
+                index.append(offset)
+            blocks += 1
+            offset += cipher_size
+        target.write(piece)
+
+    index_offset = offset
+    for entry in index:
+        target.write(OFFSET.pack(entry))
+    end = target.tell()
+
+    target.seek(start)
+    target.write(HEADER.pack(MAGIC, VERSION, bytes.fromhex(rsa.key_id(n)), plain_size, cipher_size,
+                             length, blocks, index_offset, segment_blocks))
+    target.seek(end)
+    return blocks
+
+
+class ContainerReader:
+    """Random access to the blocks of a container file through mmap.
+    Use it as a context manager or call close()"""
+
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise ValueError("empty file is not a container")
+        self.view = memoryview(self.map)
+        if len(self.view) < HEADER.size:
+            self.close()
+            raise ValueError("file is too short to be a container")
+        (magic, version, key_id, self.plain_size, self.cipher_size, self.length,
+         self.block_count, self.index_offset, self.segment_blocks) = HEADER.unpack_from(self.view)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("not a version %d container" % VERSION)
+        self.key_id = key_id.hex()
+        segments = -(-self.block_count // self.segment_blocks)
+        if self.index_offset + segments * OFFSET.size > len(self.view):
+            self.close()
+            raise ValueError("container is truncated")
+        self.index = [OFFSET.unpack_from(self.view, self.index_offset + i * OFFSET.size)[0]
+                      for i in range(segments)]
+
+    def block_offset(self, block):
+        #file offset of a block, found from its segment's index entry
+        segment, inside = divmod(block, self.segment_blocks)
+        return self.index[segment] + inside * self.cipher_size
+
+    def raw_blocks(self, start, stop):
+        """Zero-copy memoryview of the ciphertext for blocks start..stop-1"""
+        if not 0 <= start <= stop <= self.block_count:
+            raise IndexError("block range out of bounds")
+        if start == stop:
+            return self.view[0:0]
+        #blocks are contiguous, so only the first offset is needed
+        first = self.block_offset(start)
+        return self.view[first:first + (stop - start) * self.cipher_size]
+
+    def decrypt_blocks(self, key, n, start, stop):
+        """Plaintext for blocks start..stop-1 (padding removed past the end of the data)"""
+        if rsa.key_id(n) != self.key_id:
+            raise ValueError("container was written for key " + self.key_id)
+        plain = rsa._decrypt_blocks(key, n, self.raw_blocks(start, stop), self.plain_size, self.cipher_size)
+        end = min(stop * self.plain_size, self.length) - start * self.plain_size
+        return bytes(plain[:max(end, 0)])
+
+    def decrypt_range(self, key, n, offset, size):
+        """Plaintext bytes offset..offset+size-1, only the blocks covering them are decrypted"""
+        size = max(0, min(size, self.length - offset))
+        if size == 0:
+            return b""
+        start = offset // self.plain_size
+        stop = -(-(offset + size) // self.plain_size)
+        plain = self.decrypt_blocks(key, n, start, stop)
+        skip = offset - start * self.plain_size
+        return plain[skip:skip + size]
+
+    def close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,148 @@
+#   a212_rsa_hybrid.py
+#   Hybrid encryption: RSA only wraps a random 32 byte session key,
+#   the data itself goes through a keystream made with hashlib's shake_256
+#   (counter mode) and is authenticated with HMAC-SHA256
+#
+#   header   magic, version, key id, wrapped key length, wrapped key, nonce
+#   body     data XOR keystream
+#   tag      32 byte HMAC-SHA256 of header + body
+#
+#   The session key has to fit in a single RSA block (a modulus of 265
+#   bits or more, keySize 133). Smaller keys are refused: wrapped a byte or two per block,
+#   anyone with the public key could look each block up in a table of every
+#   possible value and get the session key back
+import hashlib
+import hmac
+import itertools
+import secrets
+import struct
+
+import rsa as rsa
+
+MAGIC = b"RSAH"
+VERSION = 1
+HEADER = struct.Struct(">4sB8sH")
+NONCE_SIZE = 16
+TAG_SIZE = 32
+SESSION_KEY_SIZE = 32
+#keystream is made one segment per hash call, counter = segment number
+#64 KiB keeps the XOR in cache, bigger segments measured slower
+SEGMENT = 1 << 16
+
+
+class Keystream:
+    """XORs data with shake_256(key | nonce | counter) one segment at a time.
+    Any chunk sizes work, the position carries over between calls"""
+
+    def __init__(self, key, nonce):
+        self.prefix = key + nonce
+        self.counter = 0
+        self.block = b""
+        self.used = 0
+
+    def _next(self):
+        self.block = hashlib.shake_256(self.prefix + self.counter.to_bytes(8, "big")).digest(SEGMENT)
+        self.counter += 1
+        self.used = 0
+
+    def xor(self, data):
+        out = []
+        view = memoryview(data)
+        while len(view):
+            if self.used == len(self.block):
+                self._next()
+            take = min(len(view), len(self.block) - self.used)
+            stream = self.block[self.used:self.used + take]
+            #one big-int XOR does the whole piece at C speed
+            mixed = int.from_bytes(view[:take], "little") ^ int.from_bytes(stream, "little")
+            out.append(mixed.to_bytes(take, "little"))
+            self.used += take
+            view = view[take:]
+        return b"".join(out)
+
+
+def _subkeys(session_key):
+    #separate keys for the keystream and the tag, both from the session key
+    stream_key = hashlib.blake2b(session_key, digest_size=32, person=b"rsa-hybrid-enc").digest()
+    mac_key = hashlib.blake2b(session_key, digest_size=32, person=b"rsa-hybrid-mac").digest()
+    return stream_key, mac_key
+
+
+def check_modulus(n):
+    #the padded session key (plus the 0x80 marker) must be one block
+    if rsa.block_sizes(n)[0] < SESSION_KEY_SIZE + 1:
+        raise ValueError("modulus is too small to wrap a %d byte session key in one block, "
+                         "use a keySize of at least 133" % SESSION_KEY_SIZE)
+
+
+def hybrid_encrypt_stream(e, n, chunks):
+    """Yields the header, then each encrypted chunk, then the tag"""
+    check_modulus(n)
+    session_key = secrets.token_bytes(SESSION_KEY_SIZE)
+    nonce = secrets.token_bytes(NONCE_SIZE)
+    wrapped = rsa.encrypt_bytes(e, n, session_key)
+    header = HEADER.pack(MAGIC, VERSION, bytes.fromhex(rsa.key_id(n)), len(wrapped)) + wrapped + nonce
+
+    stream_key, mac_key = _subkeys(session_key)
+    keystream = Keystream(stream_key, nonce)
+    mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+    mac.update(header)
+    yield header
+    for chunk in chunks:
+        cipher = keystream.xor(chunk)
+        mac.update(cipher)
+        yield cipher
+    yield mac.digest()
+
+
+def hybrid_decrypt_stream(key, n, chunks):
+    """Yields plaintext as it is decrypted. The tag is only checked once the
+    input ends, a ValueError then means everything yielded must be thrown away"""
+    check_modulus(n)
+    buffer = bytearray()
+    chunks = iter(chunks)
+    for chunk in chunks:
+        buffer += chunk
+        if len(buffer) >= HEADER.size:
+            magic, version, key_id, wrapped_size = HEADER.unpack_from(buffer)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError("not a version %d hybrid message" % VERSION)
+            if key_id.hex() != rsa.key_id(n):
+                raise ValueError("message was encrypted for key " + key_id.hex())
+            if len(buffer) >= HEADER.size + wrapped_size + NONCE_SIZE:
+                break
+    else:
+        raise ValueError("hybrid message is truncated")
+
+    end = HEADER.size + wrapped_size
+    session_key = rsa.decrypt_bytes(key, n, bytes(buffer[HEADER.size:end]))
+    nonce = bytes(buffer[end:end + NONCE_SIZE])
+    stream_key, mac_key = _subkeys(session_key)
+    keystream = Keystream(stream_key, nonce)
+    mac = hmac.new(mac_key, digestmod=hashlib.sha256)
+    mac.update(buffer[:end + NONCE_SIZE])
+    del buffer[:end + NONCE_SIZE]
+
+    #the empty chunk first deals with body bytes that came in with the header
+    for chunk in itertools.chain([b""], chunks):
+        buffer += chunk
+        #the last TAG_SIZE bytes might be the tag, keep them back
+        ready = len(buffer) - TAG_SIZE
+        if ready > 0:
+            cipher = bytes(buffer[:ready])
+            del buffer[:ready]
+            mac.update(cipher)
+            yield keystream.xor(cipher)
+    if len(buffer) != TAG_SIZE:
+        raise ValueError("hybrid message is truncated")
+    if not hmac.compare_digest(mac.digest(), bytes(buffer)):
+        raise ValueError("tag does not match, wrong key or corrupt message")
+
+
+def hybrid_encrypt(e, n, data):
+    return b"".join(hybrid_encrypt_stream(e, n, [data]))
+
+
+def hybrid_decrypt(key, n, message):
+    #whole message version, nothing is returned unless the tag checks out
+    return b"".join(hybrid_decrypt_stream(key, n, [message]))
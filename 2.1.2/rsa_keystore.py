@@ -0,0 +1,80 @@
+#   a212_rsa_keystore.py
+#   Saves keypairs to disk (one JSON file per key id) together with the
+#   CRT values, so a job can load its key instead of searching for new primes
+import json
+import os
+
+import rsa as rsa
+
+DEFAULT_PATH = os.environ.get("RSA_KEYSTORE",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "keystore"))
+
+
+class KeyStore:
+    """A folder of saved keypairs. Files are only read the first time
+    a key id is asked for, after that the KeyPair comes from the cache"""
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._cache = {}
+
+    def _file(self, key_id):
+        if not key_id or not all(c in "0123456789abcdef" for c in key_id):
+            raise KeyError(key_id)
+        return os.path.join(self.path, key_id + ".json")
+
+    def save(self, keys):
+        """Writes a KeyPair and returns its key id"""
+        key_id = rsa.key_id(keys.n)
+        private = keys.private
+        record = {
+            "key_id": key_id,
+            "bits": keys.n.bit_length(),
+            "e": keys.e, "d": keys.d, "n": keys.n,
+            "p": private.p, "q": private.q,
+            "dP": private.dP, "dQ": private.dQ, "qInv": private.qInv,
+        }
+        os.makedirs(self.path, exist_ok=True)
+        #write then rename so a crash never leaves half a key behind
+        path = self._file(key_id)
+        temp = path + ".tmp"
+        with open(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as f:
+            json.dump(record, f)
+        os.replace(temp, path)
+        self._cache[key_id] = keys
+        return key_id
+
+    def load(self, key_id):
+        """Returns the KeyPair saved under key_id, raises KeyError if there isn't one"""
+        if key_id not in self._cache:
+            try:
+                with open(self._file(key_id)) as f:
+                    record = json.load(f)
+            except FileNotFoundError:
+                raise KeyError(key_id) from None
+            self._cache[key_id] = rsa.KeyPair(record["e"], record["d"], record["n"], record["p"], record["q"],
+                                              record["dP"], record["dQ"], record["qInv"])
+        return self._cache[key_id]
+
+    def ids(self):
+        #lists what is saved without loading any of it
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(name[:-5] for name in os.listdir(self.path) if name.endswith(".json"))
+
+    def __contains__(self, key_id):
+        try:
+            return key_id in self._cache or os.path.exists(self._file(key_id))
+        except KeyError:
+            return False
+
+
+_default = None
+
+
+def default_keystore():
+    #one shared KeyStore (and cache) per process
+    global _default
+    if _default is None:
+        _default = KeyStore()
+    return _default
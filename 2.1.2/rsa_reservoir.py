@@ -0,0 +1,165 @@
+#   a212_rsa_reservoir.py
+#   Keeps a pool of ready primes for each key size in the background
+#   so rsa.generate_keypair doesn't have to wait for a prime search
+#
+#   reservoir = PrimeReservoir([1024, 2048])
+#   reservoir.start()             also sets rsa.primeReservoir
+#   keys = rsa.generate_keypair(1024)
+#   reservoir.metrics()
+import threading
+import time
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import rsa as rsa
+
+
+class PrimeReservoir:
+    """Bounded pool of verified primes per bit size.
+    A background thread tops a size back up to capacity once its depth
+    falls to low_water. With processes > 0 the searching happens on a
+    process pool so it doesn't compete with the caller for the GIL.
+    If a search fails the refill thread stops, the exception is kept in
+    error and take() raises from it instead of quietly returning None"""
+
+    def __init__(self, sizes, capacity=16, low_water=4, processes=0):
+        self.capacity = capacity
+        self.low_water = low_water
+        self.processes = processes
+        self.pools = {bits: deque() for bits in sizes}
+        self.stats = {bits: {"taken": 0, "misses": 0, "refilled": 0, "refill_seconds": 0.0}
+                      for bits in sizes}
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.stopping = False
+        self.thread = None
+        self.executor = None
+        self.error = None
+
+    def start(self, install=True):
+        if self.thread is not None:
+            return self
+        self.stopping = False
+        self.error = None
+        if self.processes:
+            self.executor = ProcessPoolExecutor(self.processes)
+        self.thread = threading.Thread(target=self._run, name="prime-reservoir", daemon=True)
+        self.thread.start()
+        if install:
+            rsa.primeReservoir = self
+        return self
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            self.wakeup.notify_all()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        if rsa.primeReservoir is self:
+            rsa.primeReservoir = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def take(self, bits):
+        """A prime of this size from the pool, or None if there isn't one ready.
+        Raises RuntimeError if the refill thread died"""
+        with self.lock:
+            if self.error is not None:
+                raise RuntimeError("prime reservoir stopped refilling: %r" % self.error) from self.error
+            pool = self.pools.get(bits)
+            if not pool:
+                if bits in self.stats:
+                    self.stats[bits]["misses"] += 1
+                return None
+            self.stats[bits]["taken"] += 1
+            prime = pool.popleft()
+            if len(pool) <= self.low_water:
+                self.wakeup.notify()
+            return prime
+
+    def depth(self, bits):
+        with self.lock:
+            return len(self.pools[bits])
+
+    def metrics(self):
+        """Pool depth, hits/misses, refill rate (primes per second of refilling) and
+        the error that stopped the refill thread, if any, per size"""
+        with self.lock:
+            result = {}
+            for bits, pool in self.pools.items():
+                stats = dict(self.stats[bits])
+                stats["depth"] = len(pool)
+                stats["capacity"] = self.capacity
+                seconds = stats["refill_seconds"]
+                stats["refill_rate"] = stats["refilled"] / seconds if seconds else 0.0
+                stats["error"] = repr(self.error) if self.error is not None else None
+                result[bits] = stats
+            return result
+
+    def _needs_refill(self):
+        #sizes at or below low water, each one is then filled back up to capacity
+        return [bits for bits, pool in self.pools.items() if len(pool) <= self.low_water]
+
+    def _add(self, bits, prime, started):
+        #refill_seconds is wall time spent refilling, so parallel searches show up in the rate
+        now = time.perf_counter()
+        with self.lock:
+            self.pools[bits].append(prime)
+            self.stats[bits]["refilled"] += 1
+            self.stats[bits]["refill_seconds"] += now - started
+        return now
+
+    def _fill(self, bits):
+        """Searches until this size is back at capacity, False if stopped first.
+        With a process pool up to `processes` searches run at once"""
+        started = time.perf_counter()
+        running = set()
+        try:
+            while True:
+                with self.lock:
+                    if self.stopping:
+                        return False
+                    missing = self.capacity - len(self.pools[bits]) - len(running)
+                if self.executor is None:
+                    if missing <= 0:
+                        return True
+                    started = self._add(bits, rsa.generateLargePrime(bits), started)
+                    continue
+                for i in range(min(self.processes - len(running), missing)):
+                    running.add(self.executor.submit(rsa.generateLargePrime, bits))
+                if not running:
+                    return True
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    started = self._add(bits, future.result(), started)
+        finally:
+            for future in running:
+                future.cancel()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.stopping and not self._needs_refill():
+                    self.wakeup.wait()
+                if self.stopping:
+                    return
+                sizes = self._needs_refill()
+            for bits in sizes:
+                try:
+                    if not self._fill(bits):
+                        return
+                except Exception as error:
+                    with self.lock:
+                        #while stopping this is just the executor shutting down under us
+                        if not self.stopping:
+                            self.error = error
+                    return
@@ -0,0 +1,317 @@
+#   a212_rsa_service.py
+#   Local asyncio server that keeps keys loaded and does encrypt/decrypt
+#   for other processes. Requests that arrive close together are grouped
+#   into batches and run on a process pool, so the event loop never waits
+#   on modexp work.
+#
+#   python rsa_service.py serve --unix /tmp/rsa.sock
+#   python rsa_service.py load --unix /tmp/rsa.sock --key-id <id> --requests 2000
+#
+#   Frames are length-prefixed:
+#     request   u32 length | u32 request id | u8 op (E or D) | 8 byte key id | payload
+#     response  u32 length | u32 request id | u8 status (0 ok, 1 error) | payload or error text
+#   the length counts everything after itself
+import argparse
+import asyncio
+import json
+import os
+import random
+import struct
+import sys
+import time
+
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import rsa as rsa
+import rsa_keystore as rsa_keystore
+
+LENGTH = struct.Struct(">I")
+REQUEST = struct.Struct(">IB8s")
+RESPONSE = struct.Struct(">IB")
+MAX_FRAME = 64 << 20
+
+OK = 0
+ERROR = 1
+
+
+def _run_batch(op, key, n, payloads):
+    #runs in a worker process, one result per payload so one bad request
+    #doesn't fail the rest of its batch
+    results = []
+    for payload in payloads:
+        try:
+            if op == b"E":
+                results.append((OK, rsa.encrypt_bytes(key, n, payload)))
+            else:
+                results.append((OK, rsa.decrypt_bytes(key, n, payload)))
+        except ValueError as error:
+            results.append((ERROR, str(error).encode()))
+    return results
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(LENGTH.size)
+    (length,) = LENGTH.unpack(header)
+    if length > MAX_FRAME:
+        raise ValueError("frame too large")
+    return await reader.readexactly(length)
+
+
+def write_frame(writer, body):
+    writer.write(LENGTH.pack(len(body)) + body)
+
+
+class RsaService:
+    """Collects requests from every connection into a queue. A batcher
+    waits up to max_delay (or until max_batch requests) and sends each
+    (op, key) group to the process pool as one job"""
+
+    def __init__(self, store, workers=None, max_batch=256, max_delay=0.002):
+        self.store = store
+        self.executor = ProcessPoolExecutor(workers)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.queue = asyncio.Queue()
+        #asyncio only keeps weak references to tasks, running batches are held here
+        self.running = set()
+        self.batches = 0
+        self.requests = 0
+
+    def key_for(self, op, key_id):
+        keys = self.store.load(key_id.hex())
+        if op == b"E":
+            return keys.e, keys.n
+        return keys.private, keys.n
+
+    async def batcher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = [await self.queue.get()]
+            deadline = loop.time() + self.max_delay
+            while len(pending) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            groups = defaultdict(list)
+            for op, key_id, payload, future in pending:
+                groups[(op, key_id)].append((payload, future))
+            for (op, key_id), items in groups.items():
+                self.batches += 1
+                self.requests += len(items)
+                task = loop.create_task(self.run_group(op, key_id, items))
+                self.running.add(task)
+                task.add_done_callback(self.running.discard)
+
+    async def run_group(self, op, key_id, items):
+        loop = asyncio.get_running_loop()
+        try:
+            key, n = self.key_for(op, key_id)
+            results = await loop.run_in_executor(self.executor, _run_batch, op, key, n,
+                                                 [payload for payload, future in items])
+        except KeyError:
+            results = [(ERROR, b"unknown key id")] * len(items)
+        except Exception as error:
+            results = [(ERROR, str(error).encode())] * len(items)
+        for (payload, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        lock = asyncio.Lock()
+
+        async def answer(request_id, future):
+            status, body = await future
+            async with lock:
+                write_frame(writer, RESPONSE.pack(request_id, status) + body)
+                await writer.drain()
+
+        tasks = set()
+        try:
+            while True:
+                frame = await read_frame(reader)
+                if len(frame) < REQUEST.size:
+                    break
+                request_id, op, key_id = REQUEST.unpack_from(frame)
+                op = bytes([op])
+                future = loop.create_future()
+                if op not in (b"E", b"D"):
+                    future.set_result((ERROR, b"unknown op"))
+                else:
+                    await self.queue.put((op, key_id, frame[REQUEST.size:], future))
+                task = loop.create_task(answer(request_id, future))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+            writer.close()
+
+    async def serve(self, unix=None, host="127.0.0.1", port=8212):
+        batcher = asyncio.get_running_loop().create_task(self.batcher())
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, path=unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RsaClient:
+    """Pipelined client: many requests can be waiting on one connection"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.next_id = 0
+        self.waiting = {}
+        self.listener = asyncio.get_running_loop().create_task(self._listen())
+
+    @classmethod
+    async def connect(cls, unix=None, host="127.0.0.1", port=8212):
+        if unix:
+            reader, writer = await asyncio.open_unix_connection(unix)
+        else:
+            reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer)
+
+    async def _listen(self):
+        try:
+            while True:
+                frame = await read_frame(self.reader)
+                request_id, status = RESPONSE.unpack_from(frame)
+                future = self.waiting.pop(request_id, None)
+                if future is not None and not future.done():
+                    future.set_result((status, frame[RESPONSE.size:]))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("service closed the connection"))
+
+    async def request(self, op, key_id, payload):
+        """Returns the result bytes, raises ValueError with the service's message on error"""
+        self.next_id = (self.next_id + 1) & 0xFFFFFFFF
+        request_id = self.next_id
+        future = asyncio.get_running_loop().create_future()
+        self.waiting[request_id] = future
+        write_frame(self.writer, REQUEST.pack(request_id, ord(op), bytes.fromhex(key_id)) + payload)
+        await self.writer.drain()
+        status, body = await future
+        if status != OK:
+            raise ValueError(body.decode())
+        return body
+
+    async def encrypt(self, key_id, data):
+        return await self.request("E", key_id, data)
+
+    async def decrypt(self, key_id, data):
+        return await self.request("D", key_id, data)
+
+    async def close(self):
+        self.listener.cancel()
+        self.writer.close()
+
+
+async def load_test(unix, host, port, key_id, connections, requests, size, concurrency):
+    """Sends encrypt+decrypt round trips and reports latency percentiles and throughput"""
+    clients = [await RsaClient.connect(unix, host, port) for i in range(connections)]
+    latencies = []
+    errors = 0
+
+    async def worker(client, count):
+        nonlocal errors
+        for i in range(count):
+            data = random.randbytes(size)
+            start = time.perf_counter()
+            try:
+                cipher = await client.encrypt(key_id, data)
+                plain = await client.decrypt(key_id, cipher)
+                if plain != data:
+                    errors += 1
+            except (ValueError, ConnectionError):
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    jobs = []
+    senders = connections * concurrency
+    for i in range(senders):
+        #every connection gets `concurrency` senders, the remainder is
+        #spread one each over the first few so exactly `requests` are sent
+        count = requests // senders + (i < requests % senders)
+        jobs.append(worker(clients[i % connections], count))
+    await asyncio.gather(*jobs)
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+
+    latencies.sort()
+
+    def percentile(fraction):
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    return {
+        "round_trips": len(latencies),
+        "errors": errors,
+        "seconds": elapsed,
+        "round_trips_per_s": len(latencies) / elapsed if elapsed else None,
+        "p50_ms": percentile(0.5) * 1000 if latencies else None,
+        "p99_ms": percentile(0.99) * 1000 if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local RSA service and load generator")
+    parser.add_argument("command", choices=["serve", "load"])
+    parser.add_argument("--unix", help="unix socket path (TCP is used if left out)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8212)
+    parser.add_argument("--keystore", default=rsa_keystore.DEFAULT_PATH)
+    parser.add_argument("--workers", type=int, default=None, help="processes for the serve pool")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--max-delay", type=float, default=0.002, help="seconds to wait to fill a batch")
+    parser.add_argument("--key-id", help="key to use for load (from the keystore)")
+    parser.add_argument("--connections", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=8, help="requests in flight per connection")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=64, help="bytes per message")
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        service = RsaService(rsa_keystore.KeyStore(args.keystore), args.workers, args.max_batch, args.max_delay)
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+        try:
+            asyncio.run(service.serve(args.unix, args.host, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if not args.key_id:
+        print("Error: load needs --key-id", file=sys.stderr)
+        return 1
+    try:
+        results = asyncio.run(load_test(args.unix, args.host, args.port, args.key_id, args.connections,
+                                        args.requests, args.size, args.concurrency))
+    except OSError as error:
+        print("Error: could not reach the service:", error, file=sys.stderr)
+        return 1
+    print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#   a212_rsa_stream.py
+#   Encrypts or decrypts a file (or stdin) block by block and writes the
+#   result as it goes, so memory use stays the same for any size of input
+#   python rsa_stream.py encrypt --key E --modulus N message.txt -o message.rsa
+#   python rsa_stream.py decrypt --key D --modulus N message.rsa
+#   --container writes/reads the indexed format from rsa_container.py,
+#   with --blocks START:STOP to decrypt just part of it
+#   --hybrid only wraps a session key with RSA (rsa_hybrid.py), much faster for big files
+import argparse
+import sys
+
+import rsa as rsa
+import rsa_container as rsa_container
+import rsa_hybrid as rsa_hybrid
+
+
+def open_input(path):
+    if path is None or path == "-":
+        return sys.stdin.buffer
+    return open(path, "rb")
+
+
+def open_output(path):
+    if path is None or path == "-":
+        return sys.stdout.buffer
+    return open(path, "wb")
+
+
+def run(mode, key, modulus, source, target, chunk_size=1 << 16, hybrid=False):
+    #source and target are binary files, returns the number of bytes written
+    chunks = rsa.read_chunks(source, chunk_size)
+    if hybrid:
+        if mode == "encrypt":
+            stream = rsa_hybrid.hybrid_encrypt_stream(key, modulus, chunks)
+        else:
+            stream = rsa_hybrid.hybrid_decrypt_stream(key, modulus, chunks)
+    elif mode == "encrypt":
+        stream = rsa.encrypt_stream(key, modulus, chunks)
+    else:
+        stream = rsa.decrypt_stream(key, modulus, chunks)
+    written = 0
+    for piece in stream:
+        target.write(piece)
+        written += len(piece)
+    target.flush()
+    return written
+
+
+def run_container(args):
+    try:
+        if args.mode == "encrypt":
+            if args.output in (None, "-"):
+                print("Error: --container needs an -o file to write", file=sys.stderr)
+                return 1
+            source = open_input(args.input)
+            try:
+                with open(args.output, "wb") as target:
+                    rsa_container.write_container(target, args.key, args.modulus,
+                                                  rsa.read_chunks(source, args.chunk_size))
+            finally:
+                if source is not sys.stdin.buffer:
+                    source.close()
+            return 0
+
+        if args.input in (None, "-"):
+            print("Error: --container needs an input file to map", file=sys.stderr)
+            return 1
+        target = open_output(args.output)
+        with rsa_container.ContainerReader(args.input) as reader:
+            start, stop = 0, reader.block_count
+            if args.blocks:
+                first, last = args.blocks.split(":")
+                start = int(first or 0)
+                stop = int(last or reader.block_count)
+            #a segment of the index at a time keeps memory bounded on big files
+            for first in range(start, stop, reader.segment_blocks):
+                last = min(first + reader.segment_blocks, stop)
+                target.write(reader.decrypt_blocks(args.key, args.modulus, first, last))
+        target.flush()
+        return 0
+    except (ValueError, IndexError) as error:
+        print("Error:", error, file=sys.stderr)
+        return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a file through RSA in blocks")
+    parser.add_argument("mode", choices=["encrypt", "decrypt"])
+    parser.add_argument("--key", type=int, required=True, help="e to encrypt, d to decrypt")
+    parser.add_argument("--modulus", type=int, required=True)
+    parser.add_argument("input", nargs="?", help="file to read, stdin if left out")
+    parser.add_argument("-o", "--output", help="file to write, stdout if left out")
+    parser.add_argument("--chunk-size", type=int, default=1 << 16, help="bytes read at a time")
+    parser.add_argument("--container", action="store_true", help="use the indexed container format")
+    parser.add_argument("--blocks", help="START:STOP block range to decrypt from a container")
+    parser.add_argument("--hybrid", action="store_true", help="RSA-wrapped session key + fast keystream")
+    args = parser.parse_intermixed_args(argv)
+
+    if args.container:
+        return run_container(args)
+
+    source = open_input(args.input)
+    target = open_output(args.output)
+    try:
+        run(args.mode, args.key, args.modulus, source, target, args.chunk_size, args.hybrid)
+    except ValueError as error:
+        print("Error:", error, file=sys.stderr)
+        return 1
+    finally:
+        if source is not sys.stdin.buffer:
+            source.close()
+        if target is not sys.stdout.buffer:
+            target.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
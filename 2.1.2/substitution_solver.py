@@ -0,0 +1,252 @@
+#   a212_substitution_solver.py
+#   Breaks monoalphabetic substitution ciphers automatically with simulated
+#   annealing over keys, scored by English quadgram (4 letter) log-probabilities
+#
+#   There is no built-in English model, the quadgram statistics are counted
+#   from any English text you give it with --corpus (a few MB of books works well)
+#
+#   python substitution_solver.py cipher.txt --corpus english.txt --restarts 8
+import argparse
+import math
+import os
+import random
+import sys
+
+from concurrent.futures import ProcessPoolExecutor
+
+import frequency as frequency
+import letter_swapper as letter_swapper
+from main import ENGLISH_FREQ
+
+np = frequency.np
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+#weight of each symbol in a quadgram's base-26 index (same as frequency.FrequencyCounter)
+PLACES = (26 ** 3, 26 ** 2, 26, 1)
+#count given to quadgrams that never showed up in the corpus
+FLOOR = 0.01
+
+
+class QuadgramScorer:
+    """log10 probability of every a-z quadgram, indexed by the quadgram read as
+    a base-26 number. Unseen quadgrams get a small floor instead of -inf"""
+
+    def __init__(self, counts):
+        #counts is a dense sequence of 26**4 quadgram counts
+        if np is not None:
+            counts = np.asarray(counts, dtype=np.float64)
+            total = counts.sum()
+            self.logp = np.log10(np.maximum(counts, FLOOR) / total)
+        else:
+            total = sum(counts)
+            self.logp = [math.log10(max(count, FLOOR) / total) for count in counts]
+        self.total = total
+
+    @classmethod
+    def from_corpus(cls, paths):
+        """Counts quadgrams in text files (letters only, case folded)"""
+        counter = None
+        for path in paths:
+            #counted file by file so quadgrams don't run from one into the next
+            counted = frequency.count_ngrams(path, (4,), letters_only=True)
+            counter = counted if counter is None else counter.merge(counted)
+        if counter is None or counter.total < 4:
+            raise ValueError("corpus has no quadgrams to learn from")
+        if 4 in counter.dense:
+            return cls(counter.array(4))
+        counts = [0] * 26 ** 4
+        for gram, count in counter.counter(4).items():
+            counts[counter.gram_index(gram)] = count
+        return cls(counts)
+
+
+class CipherGrams:
+    """Quadgram counts of one ciphertext, counted once. A key is a list where
+    key[cipher letter] = plain letter (both 0-25). Swapping two entries of the
+    key only changes the quadgrams that contain those cipher letters, so the
+    score is updated from those alone instead of decrypting the whole text"""
+
+    def __init__(self, text):
+        if isinstance(text, str):
+            text = text.encode("latin-1", "ignore")
+        counter = frequency.FrequencyCounter((1, 4), letters_only=True)
+        counter.update(text)
+        grams = counter.counter(4)
+        self.letters = counter.total
+        self.letter_counts = [0] * 26
+        for letter, count in counter.counter(1).items():
+            self.letter_counts[letter[0] - ord("a")] = count
+        #cipher letters that actually occur, swaps always move one of these
+        self.present = [i for i in range(26) if self.letter_counts[i]]
+        self.grams = [tuple(symbol - ord("a") for symbol in gram) for gram in grams]
+        self.counts = list(grams.values())
+        if np is not None:
+            self.gram_array = np.array(self.grams, dtype=np.int64).reshape(-1, 4)
+            self.count_array = np.array(self.counts, dtype=np.float64)
+            self.places = np.array(PLACES, dtype=np.int64)
+            #which distinct quadgrams contain each cipher letter
+            self.contains = [(self.gram_array == letter).any(axis=1) for letter in range(26)]
+        else:
+            self.rows = [[] for letter in range(26)]
+            for row, gram in enumerate(self.grams):
+                for letter in set(gram):
+                    self.rows[letter].append(row)
+
+    def frequency_key(self):
+        """Starting key: most common cipher letter -> e, next -> t, and so on"""
+        english = sorted(range(26), key=lambda i: -ENGLISH_FREQ[i])
+        cipher = sorted(range(26), key=lambda i: -self.letter_counts[i])
+        key = [0] * 26
+        for c, p in zip(cipher, english):
+            key[c] = p
+        return key
+
+    def plain_index(self, key):
+        """Index of every distinct quadgram once decrypted with key"""
+        if np is not None:
+            return np.asarray(key)[self.gram_array] @ self.places
+        return [((key[a] * 26 + key[b]) * 26 + key[c]) * 26 + key[d] for a, b, c, d in self.grams]
+
+    def score(self, scorer, plain):
+        if np is not None:
+            return float(self.count_array @ scorer.logp[plain])
+        logp = scorer.logp
+        return sum(count * logp[index] for count, index in zip(self.counts, plain))
+
+    def swap_delta(self, scorer, key, plain, a, b):
+        """Score change from swapping key[a] and key[b] (key is left as it is).
+        Returns the change and the (rows, new indexes) to pass to commit"""
+        logp = scorer.logp
+        swapped = list(key)
+        swapped[a], swapped[b] = key[b], key[a]
+        if np is not None:
+            rows = np.flatnonzero(self.contains[a] | self.contains[b])
+            new = np.asarray(swapped)[self.gram_array[rows]] @ self.places
+            delta = float(self.count_array[rows] @ (logp[new] - logp[plain[rows]]))
+            return delta, (rows, new)
+        rows = self.rows[a] + [row for row in self.rows[b] if a not in self.grams[row]]
+        new = []
+        delta = 0.0
+        for row in rows:
+            w, x, y, z = self.grams[row]
+            index = ((swapped[w] * 26 + swapped[x]) * 26 + swapped[y]) * 26 + swapped[z]
+            new.append(index)
+            delta += self.counts[row] * (logp[index] - logp[plain[row]])
+        return delta, (rows, new)
+
+    def commit(self, plain, change):
+        rows, new = change
+        if np is not None:
+            plain[rows] = new
+        else:
+            for row, index in zip(rows, new):
+                plain[row] = index
+
+
+def anneal(cipher, scorer, key, iterations=20000, temperature=None, rng=random):
+    """Simulated annealing from key: a random swap is always kept if it helps and
+    kept with probability exp(delta / T) if it doesn't, T falling linearly to 0.
+    Returns (best score, best key)"""
+    key = list(key)
+    plain = cipher.plain_index(key)
+    current = cipher.score(scorer, plain)
+    best, best_key = current, list(key)
+    if len(cipher.present) < 2:
+        return best, best_key
+    if temperature is None:
+        #scores grow with the text, so the starting temperature does too
+        temperature = 0.02 * max(cipher.letters, 100)
+    for step in range(iterations):
+        a = rng.choice(cipher.present)
+        b = rng.randrange(25)
+        b += b >= a
+        delta, change = cipher.swap_delta(scorer, key, plain, a, b)
+        t = temperature * (1 - step / iterations)
+        if delta >= 0 or (t > 0 and rng.random() < math.exp(delta / t)):
+            key[a], key[b] = key[b], key[a]
+            cipher.commit(plain, change)
+            current += delta
+            if current > best:
+                best, best_key = current, list(key)
+    #the running total drifts with rounding, the best key is scored again exactly
+    return cipher.score(scorer, cipher.plain_index(best_key)), best_key
+
+
+#cipher and scorer for the restart workers, sent once per process by the pool initializer
+_restartState = None
+
+def _initRestartWorker(cipher, scorer):
+    global _restartState
+    _restartState = (cipher, scorer)
+
+def _restart(index, seed, iterations, temperature):
+    cipher, scorer = _restartState
+    rng = random.Random(seed * 1000 + index)
+    if index == 0:
+        key = cipher.frequency_key()
+    else:
+        key = list(range(26))
+        rng.shuffle(key)
+    return anneal(cipher, scorer, key, iterations, temperature, rng)
+
+
+def solve(text, scorer, restarts=8, iterations=20000, temperature=None, workers=None, seed=212):
+    """Runs restarts independent anneals (the first from the letter frequency key,
+    the rest from random keys), in parallel when workers > 1.
+    Returns (score, key) where key is the 26 plain letters for cipher a-z"""
+    cipher = CipherGrams(text)
+    workers = min(workers or os.cpu_count() or 1, restarts)
+    if workers > 1:
+        with ProcessPoolExecutor(workers, initializer=_initRestartWorker, initargs=(cipher, scorer)) as executor:
+            results = list(executor.map(_restart, range(restarts), [seed] * restarts,
+                                        [iterations] * restarts, [temperature] * restarts))
+    else:
+        _initRestartWorker(cipher, scorer)
+        results = [_restart(i, seed, iterations, temperature) for i in range(restarts)]
+    score, key = max(results)
+    return score, "".join(ALPHABET[p] for p in key)
+
+
+def decipher(text, key):
+    """Applies a 26 letter key to text with letter_swapper, keeping upper/lower case"""
+    engine = letter_swapper.SubstitutionEngine(text)
+    swaps = {}
+    for cipher, plain in zip(ALPHABET, key):
+        swaps[cipher] = plain
+        swaps[cipher.upper()] = plain.upper()
+    engine.apply(swaps)
+    return engine
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Substitution cipher solver")
+    parser.add_argument("input", help="ciphertext file, - for stdin")
+    parser.add_argument("--corpus", nargs="+", required=True, help="English text to learn quadgrams from")
+    parser.add_argument("--restarts", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=20000, help="swaps tried per restart")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=212)
+    args = parser.parse_args(argv)
+
+    try:
+        scorer = QuadgramScorer.from_corpus(args.corpus)
+        if args.input == "-":
+            text = sys.stdin.read()
+        else:
+            with open(args.input, encoding="latin-1") as f:
+                text = f.read()
+    except (OSError, ValueError) as error:
+        print("Error:", error, file=sys.stderr)
+        return 1
+
+    score, key = solve(text, scorer, args.restarts, args.iterations, workers=args.workers, seed=args.seed)
+    print("key:   " + ALPHABET)
+    print("       " + key)
+    print("score:", round(score, 2))
+    print("")
+    print(decipher(text, key).text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,39 @@
-def two_words(password):
+def word_index(words):
+    #word -> position of its first appearance, only the first copy of a word
+    #is ever reached by the loops. built per call (O(N)) so a dictionary that
+    #changed in place can't leave a stale index behind
+    index = {}
+    for i, word in enumerate(words):
+        index.setdefault(word, i)
+    return index
+
+
+def two_words_fast(password, words):
+    """Same answer and guess count as the nested loops, without trying every pair.
+    The password is split at each space and both halves are looked up, the loops
+    would have reached word1 at position i1 and word2 at i2 after i1*N + i2 + 1 guesses"""
+    index = word_index(words)
+    count = len(words)
+    best = None
+    start = password.find(" ")
+    while start != -1:
+        i1 = index.get(password[:start])
+        i2 = index.get(password[start + 1:])
+        if i1 is not None and i2 is not None:
+            guesses = i1 * count + i2 + 1
+            #words with spaces in them can split more than one way, the loops find the earliest
+            if best is None or guesses < best:
+                best = guesses
+        start = password.find(" ", start + 1)
+    if best is None:
+        return False, count * count
+    return True, best
+
+
+def two_words(password, fast=False):
     words = get_dictionary()
+    if fast:
+        return two_words_fast(password, words)
     guesses = 0
 
     #get first word
@@ -13,7 +47,7 @@ def two_words(password):
             if fullword == password:
                 return True, guesses
 
-    return false, guesses
+    return False, guesses
 
 print("enter password: ice cream")
 print("analyzing two word password")